@@ -19,42 +19,151 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import hashlib
+import imp
+import logging
+import os
+import sys
+import threading
+from cStringIO import StringIO
+
+import lang_cache
+import lang_manifest
+import lang_profile
+import lang_runtime
 import pylang_codegen
+import pyre_codegen
+import pytable_codegen
+import regex
 import lang_spec_parser
 import lang_state_builder
 
+# Code generators selectable from the command line.
+BACKENDS = { "py"    : pylang_codegen.PyLangCodeGen,
+             "table" : pytable_codegen.PyTableLangCodeGen,
+             "re"    : pyre_codegen.PyReLangCodeGen }
+
+def assign_ids(constants, definitions_mapping):
+    """
+    Give the definitions that are not constants the ids 1, 2, ... in spec
+    order, in constants.
+    """
+    i = 1
+    for defn, _ in definitions_mapping:
+        if defn not in constants:
+            constants[defn] = i
+            i += 1
+    return constants
+
+def text_rules(rules):
+    """
+    True if some rule is keyed by a string literal, the text of its tokens,
+    rather than by a definition.
+    """
+    return any([rule[:1] in "\"'" for rule in rules])
+
+def int_ids(constants, definitions_mapping):
+    """
+    assign_ids() as ints by definition, for the lexers that are not
+    generated.
+    """
+    assign_ids(constants, definitions_mapping)
+    ids = {}
+    for defn, _ in definitions_mapping:
+        try:
+            ids[defn] = int(constants[defn])
+        except ValueError:
+            raise ValueError("%s: constant %s is not an int, binary and lazy "
+                             "DFAs need int ids" % (defn, constants[defn]))
+    return ids
+
 class Lang(object):
-    def __init__(self, spec, outfn, codegen):
+    def __init__(self, spec, outfn, codegen, combined=False, minimize=True,
+                 cache=None, incremental=False, text=None, profile=None,
+                 processes=1):
         assert spec    is not None
-        assert outfn   is not None
         assert codegen is not None
-        self.spec    = spec
-        self.outfn   = outfn
-        self.codegen = codegen
+        self.spec     = spec
+        # Spec contents; when given, spec only names it.
+        self.text     = text
+        self.outfn    = outfn
+        self.codegen  = codegen
+        # Determinize all definitions into one DFA instead of one per
+        # definition.
+        self.combined = combined
+        self.minimize = minimize
+        # lang_cache.DFACache reused across runs, None to build every DFA.
+        self.cache    = cache
+        # Reuse the unchanged DFAs of the previous build, as recorded in the
+        # manifest next to outfn.
+        self.incremental = incremental
+        # lang_profile.Profile timing the stages of the build.
+        self.profile  = profile or lang_profile.NO_PROFILE
+        # Processes building the DFAs of the definitions (None for one per
+        # CPU); the output does not depend on it.
+        self.processes = processes
 
-    def generate(self):
-        constants, definitions_mapping, rules, code = lang_spec_parser.parse(self.spec)
+    def manifest_path(self):
+        return self.outfn + lang_manifest.SUFFIX
+
+    def options(self):
+        return (type(self.codegen).__name__,
+                sorted(vars(self.codegen).items()),
+                self.combined,
+                self.minimize)
 
-        i = 1
-        for defn, _ in definitions_mapping:
-            if defn not in constants:
-                constants[defn] = i
-                i += 1
+    def parse(self):
+        with self.profile.stage("parse") as sizes:
+            if self.text is not None:
+                spec = lang_spec_parser.parse_text(self.text)
+            else:
+                spec = lang_spec_parser.parse(self.spec)
+            sizes["definitions"] = len(spec[1])
+        return spec
 
+    def generate(self):
+        assert self.outfn is not None
+        output = self.source()
+
+        # Leave an unchanged lexer (and its bytecode) alone.
+        if os.path.exists(self.outfn):
+            with open(self.outfn) as fh:
+                if fh.read() == output:
+                    logging.info("%s is up to date" % self.outfn)
+                    return
         with open(self.outfn, "w") as fh:
+            fh.write(output)
+
+    def source(self):
+        """
+        Code of the lexer.
+        """
+        constants, definitions_mapping, rules, code = self.parse()
+        assign_ids(constants, definitions_mapping)
+        self.codegen.text_rules = text_rules(rules)
+
+        definitions = None
+        if self.codegen.needs_dfa:
+            definitions = self.build_dfa(definitions_mapping)
+
+        with self.profile.stage("emit") as sizes:
+            fh = StringIO()
+
             print >>fh, self.codegen.add_header(self.spec)
             print >>fh, self.codegen.add_constants(constants)
 
-            builder = lang_state_builder.Builder(self.codegen)
-
             print >>fh, self.codegen.definitions_start()
 
-            nextstate = 0
-            for defn, patterns in definitions_mapping:
-                pattern = "|".join(patterns)
-                nextstate = builder.add_regex(pattern, nextstate, defn)
-
-            print >>fh, builder.build(nextstate)
+            if definitions is not None:
+                print >>fh, definitions
+            else:
+                if self.combined:
+                    logging.warn("Combined DFA ignored: definitions are "
+                                 "tried in spec order")
+                print >>fh, self.codegen.common_code()
+                print >>fh, self.codegen.patterns_fn(
+                    [(defn, "|".join(patterns))
+                     for defn, patterns in definitions_mapping])
 
             print >>fh, self.codegen.definitions_end()
 
@@ -64,8 +173,292 @@ class Lang(object):
 
             print >>fh, self.codegen.add_main()
 
+            output = fh.getvalue()
+            sizes["code_bytes"] = len(output)
+
+        return output
+
+    def generate_binary(self):
+        """
+        Write the DFA tables to outfn as a binary file for lang_runtime
+        instead of generating Python code. Rules and code are not included.
+        """
+        assert self.outfn is not None
+        constants, definitions_mapping, rules, code = self.parse()
+
+        ids = int_ids(constants, definitions_mapping)
+        if rules or code:
+            logging.info("Rules and code are not part of a binary DFA")
+
+        builder = lang_state_builder.Builder(self.codegen, self.minimize,
+                                             self.cache, self.profile)
+        self.build_dfa(definitions_mapping, builder)
+
+        tables = pytable_codegen.Tables(builder.transitions, builder.laststate)
+        dfa = lang_runtime.DFA.from_tables(tables, ids, self.codegen.byte_input)
+        dfa.save(self.outfn)
+
+    def lazy_tokenizer(self):
+        """
+        tokenize_all(input) scanning with lazy DFAs of the definitions
+        (regex.LazyDFA) instead of a generated lexer, for specs whose DFAs
+        are too large to build ahead: only the states the input reaches are
+        built. Rules and code are not run.
+        """
+        constants, definitions_mapping, rules, code = self.parse()
+        ids = int_ids(constants, definitions_mapping)
+
+        max_char = regex.BYTE_MAX if self.codegen.byte_input else regex.MAX_CHAR
+        names    = [defn for defn, _ in definitions_mapping]
+        patterns = ["|".join(patterns) for _, patterns in definitions_mapping]
+        if self.combined:
+            rxs = [regex.RegexSet(patterns, False, max_char,
+                                  self.profile.stage, lazy=True)]
+            ids = [[ids[defn] for defn in names]]
+        else:
+            rxs = [regex.Regex(p, False, max_char, self.profile.stage,
+                               lazy=True) for p in patterns]
+            ids = [[ids[defn]] for defn in names]
+        return lambda input: lang_runtime.tokenize_lazy(rxs, ids, input)
+
+    def build_dfa(self, definitions_mapping, builder=None):
+        if builder is None:
+            builder = lang_state_builder.Builder(self.codegen, self.minimize,
+                                                 self.cache, self.profile)
+
+        if self.incremental:
+            code = self.build_incremental(builder, definitions_mapping)
+            self.log_stats(builder)
+            return code
+
+        nextstate = 0
+        if self.combined:
+            with self.profile.unit(",".join([defn for defn, _ in
+                                             definitions_mapping])):
+                nextstate = builder.add_regexes(
+                    ["|".join(patterns) for _, patterns in definitions_mapping],
+                    nextstate,
+                    [defn for defn, _ in definitions_mapping])
+        else:
+            names = [defn for defn, _ in definitions_mapping]
+            rxs   = builder.regexes(["|".join(patterns) for _, patterns
+                                     in definitions_mapping],
+                                    names, self.processes)
+            # Numbered in spec order, whatever order they were built in.
+            for defn, rx in zip(names, rxs):
+                with self.profile.unit(defn):
+                    nextstate = builder.add_dfa(rx, nextstate, [defn])
+
+        code = builder.build(nextstate)
+        self.log_stats(builder)
+
+        return code
+
+    def build_incremental(self, builder, definitions_mapping):
+        if self.combined:
+            units = [(tuple(["|".join(patterns)
+                             for _, patterns in definitions_mapping]),
+                      tuple([defn for defn, _ in definitions_mapping]))]
+        else:
+            units = [(("|".join(patterns),), (defn,))
+                     for defn, patterns in definitions_mapping]
+        keys = lang_manifest.unit_keys(units)
+
+        unit = dict(zip(keys, units))
+
+        def unit_regexes(todo):
+            # Regex of the unit of each key of todo.
+            if self.combined:
+                rxs = {}
+                for key in todo:
+                    patterns, definitions = unit[key]
+                    with self.profile.unit(",".join(definitions)):
+                        rxs[key] = builder.regex_set(list(patterns))
+                return rxs
+            return dict(zip(todo, builder.regexes(
+                [unit[key][0][0] for key in todo],
+                [unit[key][1][0] for key in todo], self.processes)))
+
+        old = lang_manifest.Manifest.load(self.manifest_path(), self.options())
+
+        rxs    = {}
+        starts = None
+        if old is not None:
+            rxs    = unit_regexes([k for k in keys if k not in old.units])
+            starts = old.layout(keys, dict([(k, builder.dfa_size(rx))
+                                            for k, rx in rxs.items()]))
+        if starts is None:
+            # Fresh layout: all units back to back in spec order.
+            old    = lang_manifest.Manifest(self.options())
+            rxs.update(unit_regexes([k for k in keys if k not in rxs]))
+            starts = {}
+            nextstate = 0
+            for key in keys:
+                starts[key] = nextstate
+                nextstate += builder.dfa_size(rxs[key])
+
+        sizes = dict([(k, builder.dfa_size(rxs[k]) if k in rxs
+                          else old.units[k].size) for k in keys])
+        laststate = max([starts[k] + sizes[k] for k in keys] + [0])
+
+        manifest = lang_manifest.Manifest(self.options())
+        for i, (key, (_, definitions)) in enumerate(zip(keys, units)):
+            # Definitions are still tried in spec order.
+            next_start = starts[keys[i+1]] if i+1 < len(keys) else laststate
+
+            if key in rxs:
+                code_len, ntransitions = len(builder.code), len(builder.transitions)
+                with self.profile.unit(",".join(definitions)):
+                    builder.add_dfa(rxs[key], starts[key], list(definitions),
+                                    next_start)
+                unit = lang_manifest.Unit(starts[key], sizes[key],
+                                          builder.code[code_len:],
+                                          builder.transitions[ntransitions:])
+            else:
+                unit = old.units[key]
+                builder.add_built(unit.code, unit.dstates(next_start))
+            manifest.units[key] = unit
+
+        logging.info("Incremental: %d of %d DFAs rebuilt"
+                     % (len(rxs), len(keys)))
+
+        code = builder.build(laststate)
+        manifest.save(self.manifest_path())
+        return code
+
+    def log_stats(self, builder):
+        logging.info("Total: %s" % " ".join(["%s=%d" % (k, builder.stats[k])
+                                             for k in sorted(builder.stats)]))
+        if self.cache is not None:
+            logging.info("Cache: %s size=%d" % (
+                " ".join(["%s=%d" % (k, self.cache.stats[k])
+                          for k in sorted(self.cache.stats)]),
+                self.cache.size))
+
+_compiled      = {}
+_compiled_lock = threading.Lock()
+
+def compile(spec, backend="py", byte_input=False, spans=False, combined=False,
+            minimize=True, cache=None, instrument=False):
+    """
+    Generate a lexer in memory and return its class, without writing files.
+
+    spec is the text of a specification or, if it is a single line, the
+    path of one (IOError if there is no such file). The module of
+    the class (sys.modules[cls.__module__]) holds the constants and
+    tokenize_all(). Lexers are memoized by spec contents and options, so
+    compiling the same spec again is a dict lookup.
+    """
+    if "\n" in spec:
+        name, text = "<string>", spec
+    else:
+        name = spec
+        with open(spec) as fh:
+            text = fh.read()
+
+    key = hashlib.sha1(repr((text, backend, byte_input, spans, combined,
+                             minimize, instrument))).hexdigest()
+
+    with _compiled_lock:
+        if key not in _compiled:
+            codegen = BACKENDS[backend](byte_input=byte_input, spans=spans,
+                                        instrument=instrument)
+            source  = Lang(name, None, codegen, combined=combined,
+                           minimize=minimize, cache=cache, text=text).source()
+
+            module = imp.new_module("lang_lexer_%s" % key)
+            module.__file__ = name
+            exec source in module.__dict__
+            sys.modules[module.__name__] = module
+
+            _compiled[key] = getattr(module, codegen.class_name())
+
+        return _compiled[key]
+
 if __name__ == '__main__':
-    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lexical ANalyzer Generator")
+    parser.add_argument("spec", help="LANG specification file")
+    parser.add_argument("outfn", nargs="?", help="Generated lexer")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="py",
+                        help="Code generator (default: py)")
+    parser.add_argument("--bytes", action="store_true",
+                        help="Scan bytes (mmap/buffer input) instead of text")
+    parser.add_argument("--spans", action="store_true",
+                        help="Slice token text only when yytoken() is called")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Count chars, fails, retracts, tokens and rules "
+                        "(see the stats() method of the lexer)")
+    parser.add_argument("--binary", action="store_true",
+                        help="Write a binary DFA for lang_runtime instead of "
+                        "Python code (table backend, no rules)")
+    parser.add_argument("--lazy", metavar="INPUT",
+                        help="Print the tokens of INPUT scanned with lazy "
+                        "DFAs of the definitions instead of generating a "
+                        "lexer (no rules)")
+    parser.add_argument("--combined", action="store_true",
+                        help="Compile all definitions into one DFA")
+    parser.add_argument("--no-minimize", dest="minimize", action="store_false",
+                        help="Skip DFA minimization")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="Reuse compiled DFAs cached in DIR")
+    parser.add_argument("--cache-size", type=int, default=lang_cache.MAX_SIZE,
+                        help="Cache size limit in bytes (default: %d)"
+                        % lang_cache.MAX_SIZE)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Rebuild only the definitions changed since the "
+                        "last --incremental build")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time, memory and sizes of every stage "
+                        "and definition of the build")
+    parser.add_argument("--profile-json", metavar="FILE",
+                        help="Write the profile of the build as JSON")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="Build the DFAs of the definitions in N "
+                        "processes, 0 for one per CPU (default: 1)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Log build statistics")
+    args = parser.parse_args()
+    if args.outfn is None and args.lazy is None:
+        parser.error("outfn is required")
+
+    if args.verbose:
+        logging.getLogger().setLevel('INFO')
+
+    if args.binary:
+        # Only the tables are written.
+        args.backend = "table"
+
+    codegen = BACKENDS[args.backend](byte_input=args.bytes, spans=args.spans,
+                                     instrument=args.instrument)
+
+    cache = None
+    if args.cache:
+        cache = lang_cache.DFACache(args.cache, args.cache_size)
+
+    profile = None
+    if args.profile or args.profile_json:
+        profile = lang_profile.Profile()
+
+    lex = Lang(args.spec, args.outfn, codegen,
+               combined=args.combined, minimize=args.minimize, cache=cache,
+               incremental=args.incremental, profile=profile,
+               processes=args.processes or None)
+    if args.lazy:
+        with open(args.lazy, "rb") as fh:
+            input = fh.read()
+        names = dict([(v, k) for k, v in
+                      int_ids(*lex.parse()[:2]).items()])
+        for d, start, end in zip(*lex.lazy_tokenizer()(input)):
+            print names[d], repr(input[start:end])
+    elif args.binary:
+        lex.generate_binary()
+    else:
+        lex.generate()
 
-    lex = Lang(sys.argv[1], sys.argv[2], pylang_codegen.PyLangCodeGen())
-    lex.generate()
+    if args.profile:
+        profile.report()
+    if args.profile_json:
+        with open(args.profile_json, "w") as fh:
+            profile.dump(fh)
@@ -0,0 +1,377 @@
+"""
+Benchmarks of generated lexers.
+
+Every spec (sample.lang and synthetic ones stressing keywords, large
+classes, long comments and long failing scans) is compiled with every
+backend and mode (byte input, combined DFA, spans, instrumentation,
+streaming), and run over a synthetic corpus of the requested size, both
+token by token (nexttoken, running the rules) and in bulk (tokenize_all).
+Each case runs in its own process and reports tokens/s, MB/s and peak
+memory. With --build, the generator itself is
+timed instead, stage by stage, on definitions with large DFAs, many symbols
+or many patterns. Results can be written as JSON and compared against an
+earlier run.
+
+Python 2 has no tracemalloc: peak memory is the growth of the peak RSS of
+the process.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+import lang
+import lang_profile
+import regex
+
+SIZE = 1 << 18
+
+# Chunks of the corpus fed to streaming lexers.
+BUFSIZE = 65536
+
+# -------------------
+# Specs and corpora
+# -------------------
+
+def _fill(pieces, size, seed):
+    rnd = random.Random(seed)
+    out = []
+    n   = 0
+    while n < size:
+        p = rnd.choice(pieces)
+        out.append(p)
+        n += len(p)
+    return "".join(out)
+
+def _spec(definitions):
+    # Every rule returns its definition, so that nexttoken() sees each token.
+    return "%%%%Constants%%%%\n\n%%%%Definitions%%%%\n\n%s\n%%%%Rules%%%%\n\n%s\n%%%%Code%%%%\n" % (
+        "".join(["%s: %s\n\n" % d for d in definitions]),
+        "".join(["%s: return %s\n\n" % (name, name) for name, _ in definitions]))
+
+def sample_spec():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "sample.lang")
+
+def sample_corpus(size):
+    return _fill(['123', '4', ' ', '+', '"abc def"', '-', '#comment text\n',
+                  '\t', '98765', '\n'], size, 1)
+
+KEYWORDS = ["kw%s%d" % (w, i) for i in range(10)
+            for w in ["if", "else", "while", "for", "return",
+                      "class", "def", "import", "try", "with"]]
+
+def keywords_spec():
+    return _spec([("K%d" % i, kw) for i, kw in enumerate(KEYWORDS)] +
+                  [("ID", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                   ("WS", "[ \\t\\n]+")])
+
+def keywords_corpus(size):
+    return _fill([kw + " " for kw in KEYWORDS] +
+                 ["name ", "x1 ", "_tmp\n", "value_2 "] * 10, size, 2)
+
+def classes_spec():
+    return _spec([("WORD", r"[a-zA-Z0-9_\-.@$%&]+"),
+                  ("PUNCT", r"[^a-zA-Z0-9_\-.@$%& \t\n]"),
+                  ("WS", r"[ \t\n]+")])
+
+def classes_corpus(size):
+    return _fill(["user@example.com", " ", "a-b_c.d", "\n", "(", ")", "{",
+                  "}", "50%", "$x", "&&", ";", "\xe9t\xe9", "\t"], size, 3)
+
+def comments_spec():
+    return _spec([("COMMENT", r"/\*([^*]|\*+[^*/])*\*+/"),
+                  ("LINE", r"//[^\n]*\n"),
+                  ("CODE", r"[^/ \t\n]+"),
+                  ("SLASH", r"/"),
+                  ("WS", r"[ \t\n]+")])
+
+def comments_corpus(size):
+    rnd = random.Random(4)
+    pieces = ["/* " + "".join([rnd.choice("abc *\n") for _ in range(n)]) +
+              " */" for n in (500, 1000, 2000, 4000)]
+    return _fill(pieces + ["// line comment\n", "x = y / 2;\n", " "], size, 4)
+
+def backtrack_spec():
+    return _spec([("AB", "a+b"),
+                  ("AA", "a"),
+                  ("WS", "[ \\n]")])
+
+def backtrack_corpus(size):
+    # Every run of a's is scanned to its end before falling back to AA.
+    return _fill(["a" * 64 + " ", "a" * 64 + "b\n"], size, 5)
+
+SPECS = { "sample"    : (sample_spec, sample_corpus),
+          "keywords"  : (keywords_spec, keywords_corpus),
+          "classes"   : (classes_spec, classes_corpus),
+          "comments"  : (comments_spec, comments_corpus),
+          "backtrack" : (backtrack_spec, backtrack_corpus) }
+
+# (backend, bytes, combined, variant): variant is None, "spans" (token
+# offsets only), "instrument" (counters) or "stream" (the corpus read in
+# chunks; re backend lexers cannot stream).
+MODES = [("py", False, False, None),
+         ("py", False, True, None),
+         ("py", False, False, "spans"),
+         ("py", False, False, "instrument"),
+         ("py", False, False, "stream"),
+         ("table", False, False, None),
+         ("table", False, True, None),
+         ("table", True, True, None),
+         ("table", True, True, "spans"),
+         ("table", False, True, "instrument"),
+         ("table", False, True, "stream"),
+         ("re", False, False, None),
+         ("re", True, False, None),
+         ("re", True, False, "spans")]
+
+APIS = ("nexttoken", "tokenize_all")
+
+# -------------------
+# Running
+# -------------------
+
+def _chunks(corpus):
+    for i in xrange(0, len(corpus), BUFSIZE):
+        yield corpus[i:i+BUFSIZE]
+
+def _lex(lexer_class, api, corpus, stream):
+    args = (_chunks(corpus), BUFSIZE) if stream else (corpus,)
+    if api == "tokenize_all":
+        ids, _, _ = sys.modules[lexer_class.__module__].tokenize_all(*args)
+        return len(ids)
+
+    sm = lexer_class(*args)
+    n  = 0
+    while sm.nexttoken() is not None:
+        n += 1
+    return n
+
+def run_case(spec, backend, byte_input, combined, variant, api, size,
+             repeat):
+    """
+    Measure one case in the current process.
+    """
+    make_spec, make_corpus = SPECS[spec]
+    corpus = make_corpus(size)
+    stream = variant == "stream"
+
+    t = time.time()
+    lexer_class = lang.compile(make_spec(), backend, byte_input=byte_input,
+                               combined=combined, spans=variant == "spans",
+                               instrument=variant == "instrument")
+    compile_time = time.time() - t
+
+    # Memory first: later runs would not raise the peak RSS any more.
+    gc.collect()
+    rss = lang_profile._peak_rss()
+    _lex(lexer_class, api, corpus, stream)
+    peak = lang_profile._peak_rss() - rss
+
+    best = None
+    for _ in range(repeat):
+        t = time.time()
+        ntokens = _lex(lexer_class, api, corpus, stream)
+        dt = time.time() - t
+        best = dt if best is None else min(best, dt)
+
+    return { "spec"         : spec,
+             "backend"      : backend,
+             "bytes"        : byte_input,
+             "combined"     : combined,
+             "variant"      : variant,
+             "api"          : api,
+             "size"         : len(corpus),
+             "tokens"       : ntokens,
+             "seconds"      : best,
+             "tokens_per_s" : ntokens / best if best else None,
+             "mb_per_s"     : len(corpus) / best / 1e6 if best else None,
+             "compile_s"    : compile_time,
+             "peak_bytes"   : peak }
+
+def _run_case(args):
+    return run_case(*args)
+
+def run(specs, modes, apis, size, repeat):
+    cases = [(spec, backend, byte_input, combined, variant, api, size, repeat)
+             for spec in specs
+             for backend, byte_input, combined, variant in modes
+             for api in apis]
+
+    results = []
+    for case in cases:
+        # A fresh process per case keeps memory figures apart.
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            results.append(pool.apply(_run_case, (case,)))
+        finally:
+            pool.terminate()
+    return results
+
+def report(results, fh=sys.stdout):
+    print >>fh, "%-10s %-6s %-5s %-4s %-10s %-12s %10s %12s %8s %12s" % (
+        "spec", "back", "bytes", "comb", "variant", "api", "tokens",
+        "tokens/s", "MB/s", "peak")
+    for r in results:
+        print >>fh, "%-10s %-6s %-5s %-4s %-10s %-12s %10d %12.0f %8.2f %12d" % (
+            r["spec"], r["backend"], "y" if r["bytes"] else "n",
+            "y" if r["combined"] else "n", r["variant"] or "-", r["api"],
+            r["tokens"], r["tokens_per_s"], r["mb_per_s"], r["peak_bytes"])
+
+# -------------------
+# Generator builds
+# -------------------
+
+# Patterns determinized (and minimized) together, as in combined mode.
+BUILDS = { # 2^13 DFA states.
+           "blowup"   : lambda: ["(a|b)*a" + "(a|b)" * 12],
+           "keywords" : lambda: KEYWORDS + ["[a-zA-Z_][a-zA-Z0-9_]*"],
+           # One symbol per class.
+           "unicode"  : lambda: [u"[%s-%s]x" % (unichr(0x100 + 7*i),
+                                                 unichr(0x103 + 7*i))
+                                 for i in range(150)],
+           "comments" : lambda: [r"/\*([^*]|\*+[^*/])*\*+/", r"//[^\n]*\n",
+                                 r"[^/ \t\n]+", r"/", r"[ \t\n]+"] }
+
+def run_build(name, repeat):
+    """
+    Time the build of one set of patterns in the current process.
+    """
+    best = None
+    for _ in range(repeat):
+        profile = lang_profile.Profile()
+        t  = time.time()
+        rx = regex.RegexSet(BUILDS[name](), True, regex.MAX_CHAR,
+                             profile.stage)
+        dt = time.time() - t
+        if best is None or dt < best[0]:
+            best = (dt, profile)
+
+    stages, _ = best[1].by_stage()
+    return dict(rx.stats().items() +
+                [("build",   name),
+                 ("seconds", best[0]),
+                 ("stages",  dict([(s, stages[s]["seconds"])
+                                   for s in stages]))])
+
+def report_builds(results, fh=sys.stdout):
+    print >>fh, "%-10s %8s %8s %8s %8s %10s %10s %10s" % (
+        "build", "nfa", "dfa", "min_dfa", "classes", "ms", "subset ms",
+        "min ms")
+    for r in results:
+        print >>fh, "%-10s %8d %8d %8d %8d %10.1f %10.1f %10.1f" % (
+            r["build"], r["nfa_states"], r["dfa_states"], r["min_dfa_states"],
+            r["classes"], r["seconds"] * 1000,
+            r["stages"]["nfa_to_dfa"] * 1000, r["stages"]["minimize"] * 1000)
+
+def compare_builds(results, baseline, fh=sys.stdout):
+    """
+    Print the change of the build time, and of the subset construction
+    alone, of each build against baseline results.
+    """
+    base = dict([(r["build"], r) for r in baseline if "build" in r])
+    for r in results:
+        b = base.get(r["build"])
+        if b is None:
+            continue
+        for name, old, new in [
+                ("", b["seconds"], r["seconds"]),
+                (" nfa_to_dfa", b["stages"]["nfa_to_dfa"],
+                 r["stages"]["nfa_to_dfa"])]:
+            print >>fh, "%-21s %10.1f -> %10.1f ms %8.1fx" % (
+                r["build"] + name, old * 1000, new * 1000,
+                old / new if new else 0)
+
+def case_key(r):
+    # Results written before variants were benchmarked have none.
+    return (r["spec"], r["backend"], r["bytes"], r["combined"],
+            r.get("variant"), r["api"])
+
+def compare(results, baseline, fh=sys.stdout):
+    """
+    Print the MB/s change of each case against baseline results.
+    """
+    base = dict([(case_key(r), r) for r in baseline])
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None or not b["mb_per_s"]:
+            continue
+        change = (r["mb_per_s"] / b["mb_per_s"] - 1) * 100
+        print >>fh, "%-48s %8.2f -> %8.2f MB/s %+7.1f%%" % (
+            " ".join([str(k) for k in case_key(r)]),
+            b["mb_per_s"], r["mb_per_s"], change)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark generated lexers")
+    parser.add_argument("--size", type=int, default=SIZE,
+                        help="Corpus size in bytes (default: %d)" % SIZE)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per case, the best is reported")
+    parser.add_argument("--specs", default=",".join(sorted(SPECS)),
+                        help="Comma separated specs (default: all)")
+    parser.add_argument("--backends", default="py,table,re",
+                        help="Comma separated backends (default: all)")
+    parser.add_argument("--apis", default=",".join(APIS),
+                        help="Comma separated APIs (default: all)")
+    parser.add_argument("--build", action="store_true",
+                        help="Time the generator instead of the lexers")
+    parser.add_argument("--builds", default=",".join(sorted(BUILDS)),
+                        help="Comma separated builds for --build "
+                        "(default: all)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="Compare with results written by --json")
+    args = parser.parse_args()
+
+    if args.build:
+        results = [run_build(name, args.repeat)
+                   for name in args.builds.split(",")]
+        report_builds(results)
+    else:
+        backends = args.backends.split(",")
+        results  = run(args.specs.split(","),
+                       [m for m in MODES if m[0] in backends],
+                       args.apis.split(","),
+                       args.size, args.repeat)
+        report(results)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({ "python"   : platform.python_version(),
+                        "platform" : platform.platform(),
+                        "time"     : time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "results"  : results }, fh, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)["results"]
+        if args.build:
+            compare_builds(results, baseline)
+        else:
+            compare(results, baseline)
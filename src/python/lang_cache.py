@@ -0,0 +1,193 @@
+"""
+On-disk cache of compiled DFAs.
+
+Entries are content addressed: the key is a hash of the cache version (a
+hash of the sources building the DFAs), the pattern(s) and the build
+options, so an unchanged definition is loaded
+instead of going through transform, NFA construction, subset construction
+and minimization again. The cache directory is capped in size; the least
+recently used entries are evicted first.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+
+# Sources whose changes may change what gets built: entries built by other
+# versions of them are never used.
+SOURCES = ("regex.py", "lang_state_builder.py", "lang_cache.py")
+
+def sources_version(names=SOURCES):
+    h    = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in names:
+        with open(os.path.join(here, name), "rb") as fh:
+            h.update(fh.read())
+    return h.hexdigest()
+
+CACHE_VERSION = sources_version()
+
+MAX_SIZE = 64 << 20
+
+SUFFIX = ".dfa"
+
+class CompiledDFA(object):
+    """
+    The part of a Regex (or RegexSet) the Builder needs, with DFA states
+    renumbered 0..n-1 in the order of the original state tuples, so that
+    it generates the same code as the Regex itself.
+    """
+    def __init__(self, rx):
+        table  = rx.dfa_table()
+        states = set(table)
+        states.add(rx.dfa_start())
+        for row in table.values():
+            states.update(row.values())
+        number = dict([(s, i) for i, s in enumerate(sorted(states))])
+
+        self._dfa_start = number[rx.dfa_start()]
+        self._dfa_table = dict([(number[s],
+                                 dict([(k, number[n]) for k, n in row.items()]))
+                                for s, row in table.items()])
+        self._accepts   = dict([(number[s], rx.accepts(s)) for s in states
+                                if rx.accepts(s) is not None])
+        self._classes   = rx.classes()
+        self._stats     = dict(rx.stats())
+
+    def stats(self):
+        return self._stats
+
+    def dfa_start(self):
+        return self._dfa_start
+
+    def dfa_table(self):
+        return self._dfa_table
+
+    def accepts(self, state):
+        return self._accepts.get(state)
+
+    def classes(self):
+        return self._classes
+
+
+class DFACache(object):
+    def __init__(self, path, max_size=MAX_SIZE):
+        assert path is not None
+        self.path     = path
+        self.max_size = max_size
+        self.stats    = { "hits" : 0, "misses" : 0, "evictions" : 0 }
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.size = sum([os.path.getsize(fn) for fn, _ in self._entries()])
+        if self.size > self.max_size:
+            self._evict(None)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr((CACHE_VERSION,) + parts)).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + SUFFIX)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(SUFFIX):
+                fn = os.path.join(self.path, name)
+                entries.append((fn, os.path.getmtime(fn)))
+        return entries
+
+    def get(self, key):
+        """
+        Cached object of key, None on a miss.
+        """
+        fn = self._filename(key)
+        try:
+            with open(fn, "rb") as fh:
+                obj = cPickle.load(fh)
+        except IOError:
+            self.stats["misses"] += 1
+            return None
+        except Exception, e:
+            logging.warn("Dropping unreadable cache entry %s: %s" % (fn, e))
+            self._remove(fn)
+            self.stats["misses"] += 1
+            return None
+
+        # mtime is the last use, for eviction.
+        os.utime(fn, None)
+        self.stats["hits"] += 1
+        return obj
+
+    def put(self, key, obj):
+        data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_size:
+            return
+
+        fn = self._filename(key)
+        if os.path.exists(fn):
+            self.size -= os.path.getsize(fn)
+
+        # Write then rename so that concurrent builds never see half an entry.
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.rename(tmp, fn)
+        self.size += len(data)
+
+        if self.size > self.max_size:
+            self._evict(fn)
+
+    def _remove(self, fn):
+        try:
+            size = os.path.getsize(fn)
+            os.remove(fn)
+        except OSError:
+            return
+        self.size -= size
+
+    def _evict(self, keep):
+        for fn, _ in sorted(self._entries(), key=lambda e: e[1]):
+            if self.size <= self.max_size:
+                break
+            if fn != keep:
+                self._remove(fn)
+                self.stats["evictions"] += 1
+
+    def dfa(self, build, *parts):
+        """
+        CompiledDFA for the key parts: loaded from the cache, or built from
+        the Regex returned by build() and stored.
+        """
+        key = self.key(*parts)
+        dfa = self.get(key)
+        if dfa is None:
+            dfa = CompiledDFA(build())
+            self.put(key, dfa)
+        return dfa
+
+    def clear(self):
+        for fn, _ in self._entries():
+            self._remove(fn)
@@ -20,6 +20,13 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 class LangCodeGen(object):
+    # False if the backend matches the definitions itself (patterns_fn)
+    # instead of emitting the DFA built by lang_state_builder.Builder.
+    needs_dfa = True
+    # True if the generated lexer scans bytes (byte alphabet) instead of
+    # unicode text.
+    byte_input = False
+
     @staticmethod
     def nyi():
         raise "Not Yet Implemented"
@@ -33,16 +40,26 @@ class LangCodeGen(object):
     def common_code(self):
         CodeGen.nyi()
 
-    def match_fn_start(self, state, has_conditions):
+    def match_fn_start(self, state, has_conditions, definition):
         CodeGen.nyi()
 
-    def match_fn_condition(self, c, nextstate):
+    def match_fn_condition(self, intervals, nextstate):
         CodeGen.nyi()
 
-    def match_fn_end(self, accepting, definition, should_retract):
+    def match_fn_end(self, accepting, definition, has_conditions):
         CodeGen.nyi()
     
     def transitions_fn(self, transitions, laststate):
+        """
+        transitions is the list of lang_state_builder.DState.
+        """
+        CodeGen.nyi()
+
+    def patterns_fn(self, definitions):
+        """
+        definitions is the list of (definition, pattern) in spec order.
+        Only called when needs_dfa is False.
+        """
         CodeGen.nyi()
 
     def add_main(self):
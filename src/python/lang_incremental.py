@@ -0,0 +1,256 @@
+"""
+Incremental re-lexing of an edited text.
+
+TokenBuffer keeps the tokens of a text as parallel arrays (definitions,
+starts, ends and lookaheads, the end of the text looked at to find each
+token). After an edit, lexing restarts at the first token that looked at
+the edited text and stops as soon as a new token ends where an old one
+ended past the edit: since every token starts in the start state, the rest
+of the old tokens only depend on text the edit did not touch.
+
+The text and the tokens are gap buffers, split where the last edit was.
+Offsets past the gap are kept relative to the end of the text, so they need
+no update when the text before them changes. An edit costs as much as the
+damaged region and the distance from the last edit, not the size of the
+text.
+
+Lexers of the re backend cannot tell how far they looked and record the end
+of the input, so every edit re-lexes from the start.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from array import array
+
+# Text lexed past the edit before looking for old tokens to line up with;
+# doubled on every try.
+STEP = 256
+
+# Chars handed to the lexer at a time.
+CHUNK = 4096
+
+def _arrays():
+    return array('i'), array('l'), array('l'), array('l')
+
+def _pop(a, n):
+    # The last n items of a, removed, in reverse order.
+    tail = a[len(a)-n:]
+    del a[len(a)-n:]
+    tail.reverse()
+    return tail
+
+def _shift(values, delta):
+    return array(values.typecode, map(delta.__add__, values))
+
+class _Text(object):
+    """
+    Text as a gap buffer: the chars before the gap, and the chars after it
+    in reverse order.
+    """
+    def __init__(self, text):
+        self.typecode = 'u' if isinstance(text, unicode) else 'c'
+        self.before   = array(self.typecode, text)
+        self.after    = array(self.typecode)
+
+    def __len__(self):
+        return len(self.before) + len(self.after)
+
+    def _string(self, chars):
+        return chars.tounicode() if self.typecode == 'u' else \
+               chars.tostring()
+
+    def value(self):
+        after = self.after[:]
+        after.reverse()
+        return self._string(self.before + after)
+
+    def move(self, pos):
+        # Move the gap to pos.
+        if pos < len(self.before):
+            self.after.extend(_pop(self.before, len(self.before) - pos))
+        elif pos > len(self.before):
+            self.before.extend(_pop(self.after, pos - len(self.before)))
+
+    def replace(self, pos, removed, inserted):
+        # Replace removed chars at pos by inserted, returning what was removed.
+        self.move(pos)
+        gone = _pop(self.after, removed)
+        self.before.extend(array(self.typecode, inserted))
+        return self._string(gone)
+
+    def chunks(self, pos, size=CHUNK):
+        # The text from pos on, read lazily, size chars at a time.
+        while pos < len(self.before):
+            yield self._string(self.before[pos:pos+size])
+            pos = min(pos + size, len(self.before))
+        j = len(self) - pos
+        while j > 0:
+            chunk = self.after[max(j-size, 0):j]
+            chunk.reverse()
+            yield self._string(chunk)
+            j -= size
+
+class TokenBuffer(object):
+    def __init__(self, lexer_class, text):
+        self.lexer_class = lexer_class
+        self._text = _Text(text)
+
+        # Tokens before the gap, and after it in reverse order with offsets
+        # relative to the end of the text.
+        self._before = _arrays()
+        self._after  = _arrays()
+        ids, starts, ends, lookaheads = self._before
+        self._lexer(0, text).tokenize_into(ids, starts, ends, None, lookaheads)
+        # No token looked further than this past its start.
+        self.reach = max([la - s for s, la in zip(self._before[1],
+                                                   self._before[3])] + [0])
+
+    def __len__(self):
+        return len(self._before[0]) + len(self._after[0])
+
+    @property
+    def text(self):
+        return self._text.value()
+
+    def _lexer(self, begin, text=None):
+        if text is not None or not getattr(self.lexer_class, "streams", True):
+            lexer = self.lexer_class(text if text is not None
+                                     else self._text.value())
+            lexer.lexeme_begin = lexer.input_index = begin
+        else:
+            lexer = self.lexer_class(self._text.chunks(begin), CHUNK)
+            lexer.offset = begin
+        return lexer
+
+    def _get(self, k, i):
+        # Offset k (1: start, 2: end, 3: lookahead) of token i.
+        before = self._before[k]
+        if i < len(before):
+            return before[i]
+        after = self._after[k]
+        return after[len(after) - 1 - (i - len(before))] + len(self._text)
+
+    def _bisect(self, k, offset, lo=0):
+        # First token from lo on whose offset k is at least offset.
+        hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get(k, mid) < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _move(self, g):
+        # Move the gap of the tokens to before token g.
+        n = len(self._text)
+        if g < len(self._before[0]):
+            m = len(self._before[0]) - g
+            for k, (before, after) in enumerate(zip(self._before,
+                                                     self._after)):
+                tail = _pop(before, m)
+                after.extend(_shift(tail, -n) if k else tail)
+        elif g > len(self._before[0]):
+            m = g - len(self._before[0])
+            for k, (before, after) in enumerate(zip(self._before,
+                                                     self._after)):
+                head = _pop(after, m)
+                before.extend(_shift(head, n) if k else head)
+
+    def _restart(self, offset):
+        # First token that looked at text at or after offset.
+        k = self._bisect(2, offset + 1)
+        j = self._bisect(1, offset - self.reach)
+        for i in xrange(j, k):
+            if self._get(3, i) > offset:
+                return i
+        return k
+
+    def edit(self, offset, removed, inserted):
+        """
+        Replace removed chars at offset by the text inserted and re-lex.
+        Returns (first, old, new): tokens first to first+old of the old
+        stream were replaced by first to first+new.
+        """
+        assert 0 <= offset and offset + removed <= len(self._text)
+
+        new_end = offset + len(inserted)
+
+        first = self._restart(offset)
+        begin = self._get(1, first) if first < len(self) else \
+                (self._get(2, first - 1) if first else 0)
+
+        # Old tokens from first on are after the gap: past the edit, their
+        # offsets follow the text.
+        self._move(first)
+        gone = self._text.replace(offset, removed, inserted)
+        try:
+            lexer = self._lexer(begin)
+            ids, starts, ends, lookaheads = _arrays()
+            after = self._after
+
+            # Old tokens the new stream replaces, None until it lines up.
+            old  = None
+            stop = new_end + STEP
+            n    = 0
+            while old is None:
+                lexer.tokenize_into(ids, starts, ends, stop, lookaheads)
+                for i in xrange(n, len(ids)):
+                    e = ends[i]
+                    if e < new_end:
+                        continue
+                    # Old tokens starting before the edit ended are at least
+                    # as far before new_end: only those past it can match.
+                    m = self._bisect(1, e, first)
+                    if m < len(self) and self._get(1, m) == e:
+                        old = m - first
+                        del ids[i+1:], starts[i+1:], ends[i+1:], \
+                            lookaheads[i+1:]
+                        break
+                n = len(ids)
+                if old is None and lexer.eof():
+                    old = len(after[0])
+                    break
+                stop += stop - offset
+        except Exception:
+            self._text.replace(offset, len(inserted), gone)
+            raise
+
+        for a in after:
+            del a[len(a)-old:]
+        for a, new in zip(self._before, (ids, starts, ends, lookaheads)):
+            a.extend(new)
+
+        self.reach = max([self.reach] + [la - s for s, la in
+                                         zip(starts, lookaheads)])
+
+        return first, old, len(ids)
+
+    def tokens(self):
+        """
+        Definitions, starts and ends of all tokens, as parallel arrays.
+        """
+        n = len(self._text)
+        out = []
+        for k, (before, after) in enumerate(zip(self._before[:3],
+                                                self._after[:3])):
+            tail = after[:]
+            tail.reverse()
+            out.append(before + (_shift(tail, n) if k else tail))
+        return tuple(out)
@@ -0,0 +1,141 @@
+"""
+Manifest of a generated lexer, for incremental regeneration.
+
+A unit is what gets determinized into one DFA: one definition, or all of
+them in combined mode. The manifest keeps, for every unit of the last build,
+its state numbers and the code and DStates generated for it. When the spec
+changes, unchanged units keep their states and code; only new or changed
+units are built, into free state numbers.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+
+import lang_state_builder
+
+MANIFEST_VERSION = 1
+
+SUFFIX = ".manifest"
+
+def unit_keys(units):
+    """
+    Key of each (patterns, definitions) unit. Repeated units are numbered
+    by occurrence so that keys stay unique.
+    """
+    keys = []
+    seen = {}
+    for unit in units:
+        n = seen[unit] = seen.get(unit, -1) + 1
+        keys.append(hashlib.sha1(repr(unit + (n,))).hexdigest())
+    return keys
+
+class Unit(object):
+    def __init__(self, start, size, code, transitions):
+        self.start = start
+        self.size  = size
+        self.code  = code
+        # (state, fn_name, edges, definition) of each DState.
+        self.transitions = [(t.state, t.fn_name, t.edges, t.definition)
+                            for t in transitions]
+
+    def dstates(self, next_start):
+        return [lang_state_builder.DState(state, fn_name, edges, definition,
+                                          next_start)
+                for state, fn_name, edges, definition in self.transitions]
+
+
+class Manifest(object):
+    def __init__(self, options):
+        self.version = MANIFEST_VERSION
+        self.options = options
+        self.units   = {}
+
+    @staticmethod
+    def load(path, options):
+        """
+        Manifest saved in path, None if there is none or it was built with
+        other options.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as fh:
+                manifest = cPickle.load(fh)
+        except Exception, e:
+            logging.warn("Ignoring unreadable manifest %s: %s" % (path, e))
+            return None
+
+        if manifest.version != MANIFEST_VERSION or manifest.options != options:
+            logging.info("Manifest %s is out of date" % path)
+            return None
+        return manifest
+
+    def save(self, path):
+        with open(path, "wb") as fh:
+            cPickle.dump(self, fh, cPickle.HIGHEST_PROTOCOL)
+
+    def layout(self, keys, sizes):
+        """
+        Start state of every unit of keys (in spec order): units of the
+        manifest keep theirs, the others (of the given sizes) go to the first
+        gap large enough or after the last state. None if a fresh layout is
+        better: the first unit must start at state 0, and the gaps may not
+        outgrow the states in use.
+        """
+        starts = {}
+        used   = []
+        for key in keys:
+            if key in self.units:
+                unit = self.units[key]
+                starts[key] = unit.start
+                used.append((unit.start, unit.start + unit.size))
+
+        gaps = []
+        end  = 0
+        for lo, hi in sorted(used):
+            if lo > end:
+                gaps.append([end, lo])
+            end = max(end, hi)
+
+        for key in keys:
+            if key in starts:
+                continue
+            size = sizes[key]
+            for gap in gaps:
+                if gap[1] - gap[0] >= size:
+                    starts[key] = gap[0]
+                    gap[0] += size
+                    break
+            else:
+                starts[key] = end
+                end += size
+
+        if not keys or starts[keys[0]] != 0:
+            return None
+
+        total = sum([self.units[k].size if k in self.units else sizes[k]
+                     for k in keys])
+        if end - total > total:
+            return None
+
+        return starts
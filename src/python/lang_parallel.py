@@ -0,0 +1,232 @@
+"""
+Parallel lexing of a large file with a generated lexer.
+
+The file is cut into chunks just after a newline and each chunk is lexed by a
+process of a multiprocessing pool, guessing that a token starts right at the
+chunk boundary. The token streams are stitched back in order with global
+offsets. A guess is wrong when the last token of the previous chunk runs over
+the boundary (e.g. a comment or string spanning lines); the chunk is then
+lexed again from the end of that token only until a token ends where one of
+the guessed tokens starts, and the rest of the guessed tokens are kept.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import imp
+import logging
+import mmap
+import multiprocessing
+from array import array
+from itertools import izip
+
+CHUNK_SIZE = 16 << 20
+BUFSIZE    = 65536
+# Text lexed when resynchronizing before looking for a token start of the
+# guessed stream to line up with; doubled on every try.
+STEP       = 4096
+
+# Per process state set up by _init.
+_lexer   = None
+_data    = None
+_bufsize = BUFSIZE
+# The file for lexers that cannot stream (re backend, byte input): scanned
+# in place, not copied.
+_text    = None
+
+def _init(lexer_path, path, bufsize):
+    global _lexer, _data, _bufsize, _text
+    _lexer   = imp.load_source("lang_parallel_lexer", lexer_path)
+    _bufsize = bufsize
+    with open(path, "rb") as fh:
+        _data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    _text = None if getattr(_lexer.PyLexer, "streams", True) else _data
+
+def _read(begin):
+    for i in xrange(begin, len(_data), _bufsize):
+        yield _data[i:i+_bufsize]
+
+def _lexer_at(begin):
+    # Lexer of the file from begin on.
+    if _text is not None:
+        lexer = _lexer.PyLexer(_text)
+        lexer.lexeme_begin = lexer.input_index = begin
+    else:
+        lexer = _lexer.PyLexer(_read(begin), _bufsize)
+        lexer.offset = begin
+    return lexer
+
+def _lex(begin, end):
+    # Tokens starting in [begin, end), the last one possibly ending past end.
+    return _lexer_at(begin).tokenize_into(array('i'), array('l'), array('l'),
+                                          end)
+
+def _lex_range(r):
+    # Tokens guessed for [begin, end). Lexing may fail when begin is inside
+    # a token: the guess then starts again on the line after the failure.
+    # No token before a failure can start a token of the file, since lexing
+    # from one would not fail. None if every guess fails.
+    begin, end = r
+    while begin < end:
+        lexer = _lexer_at(begin)
+        try:
+            return lexer.tokenize_into(array('i'), array('l'), array('l'),
+                                       end)
+        except _lexer.LangException:
+            nl = _data.find("\n", lexer.offset + lexer.input_index)
+            if nl < 0:
+                return None
+            begin = nl + 1
+    return None
+
+def boundaries(data, chunk_size=CHUNK_SIZE):
+    """
+    [begin, end) ranges of the chunks, each ending just after a newline (or
+    at the end of data).
+    """
+    ranges = []
+    begin  = 0
+    while begin < len(data):
+        nl  = data.find("\n", begin + chunk_size)
+        end = len(data) if nl < 0 else nl + 1
+        ranges.append((begin, end))
+        begin = end
+    return ranges
+
+def _resync(tokens, pos, end):
+    """
+    Tokens starting in [pos, end), given the tokens guessed for the chunk
+    (None if lexing it failed). Lexes from pos until a token ends where a
+    guessed token starts: every token starts in the start state, so the
+    guessed ones are right from there on. Returns the tokens and the number
+    of chars lexed.
+    """
+    ids, starts, ends = array('i'), array('l'), array('l')
+    if pos >= end:
+        return (ids, starts, ends), 0
+
+    def splice(k, i):
+        # Tokens lexed up to i, then the guessed ones from k on.
+        g_ids, g_starts, g_ends = tokens
+        return (ids[:i] + g_ids[k:], starts[:i] + g_starts[k:],
+                ends[:i] + g_ends[k:]), (ends[i-1] if i else pos) - pos
+
+    def guessed(offset):
+        # Index of the guessed token starting at offset, None for none.
+        if tokens is None:
+            return None
+        k = bisect.bisect_left(tokens[1], offset)
+        return k if k < len(tokens[1]) and tokens[1][k] == offset else None
+
+    k = guessed(pos)
+    if k is not None:
+        return splice(k, 0)
+
+    lexer = _lexer_at(pos)
+    stop  = pos
+    step  = STEP
+    n     = 0
+    while True:
+        stop = min(stop + step, end)
+        lexer.tokenize_into(ids, starts, ends, stop)
+        for i in xrange(n, len(ids)):
+            k = guessed(ends[i])
+            if k is not None:
+                return splice(k, i + 1)
+        n = len(ids)
+        if stop >= end:
+            return (ids, starts, ends), (ends[-1] if ids else end) - pos
+        step *= 2
+
+def tokenize_chunks(lexer_path, path, processes=None,
+                    chunk_size=CHUNK_SIZE, bufsize=BUFSIZE):
+    """
+    Yield (definitions, starts, ends) arrays chunk by chunk, in order, for
+    the whole file path lexed by the generated lexer in lexer_path.
+    """
+    _init(lexer_path, path, bufsize)
+    if _text is not None:
+        try:
+            _lexer.PyLexer(_text)
+        except TypeError:
+            # Each process would need a copy of the whole file.
+            raise TypeError("%s: re backend lexers must take byte input "
+                            "(--bytes) to scan %s in parallel"
+                            % (lexer_path, path))
+    ranges = boundaries(_data, chunk_size) if len(_data) else []
+    if not ranges:
+        return
+
+    pool = multiprocessing.Pool(processes, _init, (lexer_path, path, bufsize))
+    try:
+        pos     = 0
+        resyncs = 0
+        relexed = 0
+        for (begin, end), tokens in izip(ranges,
+                                         pool.imap(_lex_range, ranges)):
+            if tokens is None or begin != pos or \
+                    (tokens[1] and tokens[1][0] != pos):
+                resyncs += 1
+                tokens, n = _resync(tokens, pos, end)
+                relexed  += n
+            if tokens[0]:
+                pos = tokens[2][-1]
+            yield tokens
+
+        logging.info("%d chunks, %d resynchronized, %d chars lexed again"
+                     % (len(ranges), resyncs, relexed))
+    finally:
+        pool.terminate()
+
+def tokenize_file(lexer_path, path, processes=None,
+                  chunk_size=CHUNK_SIZE, bufsize=BUFSIZE):
+    """
+    Definitions, starts and ends of all tokens of path as parallel arrays,
+    like tokenize_all() of the generated lexer.
+    """
+    ids, starts, ends = array('i'), array('l'), array('l')
+    for chunk_ids, chunk_starts, chunk_ends in tokenize_chunks(
+            lexer_path, path, processes, chunk_size, bufsize):
+        ids.extend(chunk_ids)
+        starts.extend(chunk_starts)
+        ends.extend(chunk_ends)
+    return ids, starts, ends
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Lex a file in parallel")
+    parser.add_argument("lexer", help="Generated lexer")
+    parser.add_argument("input", help="File to lex")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="Worker processes (default: #cpus)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="Approximate chunk size in bytes")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Log resynchronization statistics")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.getLogger().setLevel('INFO')
+
+    t = time.time()
+    ids, _, _ = tokenize_file(args.lexer, args.input, args.processes,
+                              args.chunk_size)
+    print "%d tokens in %.3fs" % (len(ids), time.time() - t)
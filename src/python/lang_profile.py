@@ -0,0 +1,184 @@
+"""
+Profile of the generator pipeline.
+
+Every stage of a build (parsing the spec, transform, _re2post, _post2nfa,
+_construct_nfa_table, nfa_to_dfa, minimization, _dfa_state_matcher_gen,
+the transition tables and the emission of the code) records its time, its
+growth of the peak memory and the sizes of what it built, under the unit
+(definition, or all of them in combined mode) being built. Reports break
+the build down by stage and by unit, as text or JSON.
+
+Python 2 has no tracemalloc: peak memory is the growth of the peak RSS of
+the process, so a stage only shows memory when it needs more than any stage
+before it did.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Stages in pipeline order.
+STAGES = ("parse", "transform", "re2post", "post2nfa", "nfa_table",
+          "nfa_to_dfa", "minimize", "matcher_gen", "transitions", "emit")
+
+def _peak_rss():
+    # kB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Profile(object):
+    def __init__(self):
+        # One record per stage run: unit, stage, seconds, peak_bytes, sizes.
+        self.records = []
+        self._unit   = None
+
+    @contextmanager
+    def unit(self, name):
+        """
+        Attribute the stages run within to the unit name.
+        """
+        unit, self._unit = self._unit, name
+        try:
+            yield
+        finally:
+            self._unit = unit
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the stage name. The dict yielded takes the sizes of what the
+        stage built.
+        """
+        sizes = {}
+        rss   = _peak_rss()
+        t     = time.time()
+        yield sizes
+        self.records.append({ "unit"       : self._unit,
+                              "stage"      : name,
+                              "seconds"    : time.time() - t,
+                              "peak_bytes" : _peak_rss() - rss,
+                              "sizes"      : sizes })
+
+    def merge(self, records, unit):
+        """
+        Add the records of a profile taken elsewhere (e.g. in another
+        process) under the unit.
+        """
+        for r in records:
+            self.records.append(dict(r, unit=unit))
+
+    @staticmethod
+    def _total(records, key):
+        total  = { "seconds" : 0.0, "peak_bytes" : 0, "sizes" : {} }
+        totals = {}
+        for r in records:
+            t = totals.setdefault(key(r), { "seconds"    : 0.0,
+                                            "peak_bytes" : 0,
+                                            "sizes"      : {} })
+            for s in (t, total):
+                s["seconds"]    += r["seconds"]
+                s["peak_bytes"] += r["peak_bytes"]
+                for k, v in r["sizes"].items():
+                    s["sizes"][k] = s["sizes"].get(k, 0) + v
+        return totals, total
+
+    def by_stage(self):
+        stages, total = self._total(self.records, lambda r: r["stage"])
+        # The code of the earlier stages is part of the code emitted: the
+        # output is the size of the code, not the sum.
+        if "emit" in stages and "code_bytes" in stages["emit"]["sizes"]:
+            total["sizes"]["code_bytes"] = \
+                stages["emit"]["sizes"]["code_bytes"]
+        return stages, total
+
+    def by_unit(self):
+        return self._total([r for r in self.records if r["unit"] is not None],
+                           lambda r: r["unit"])
+
+    def to_json(self):
+        stages, total = self.by_stage()
+        units, _      = self.by_unit()
+        return { "records" : self.records,
+                 "stages"  : stages,
+                 "units"   : units,
+                 "total"   : total }
+
+    def dump(self, fh):
+        json.dump(self.to_json(), fh, indent=1, sort_keys=True)
+
+    @staticmethod
+    def _sizes(sizes):
+        return " ".join(["%s=%d" % (k, sizes[k]) for k in sorted(sizes)])
+
+    def report(self, fh=sys.stderr, top=20):
+        """
+        Print the time, memory and sizes of every stage, then of the top
+        units by time.
+        """
+        stages, total = self.by_stage()
+        units, _      = self.by_unit()
+
+        line = "%-24s %10s %6s %10s  %s"
+        print >>fh, line % ("stage", "ms", "%", "peak kB", "sizes")
+        order = [s for s in STAGES if s in stages] + \
+                sorted([s for s in stages if s not in STAGES])
+        for name in order + [None]:
+            s = stages[name] if name is not None else total
+            print >>fh, line % (
+                name if name is not None else "total",
+                "%.1f" % (s["seconds"] * 1000),
+                "%.1f" % (s["seconds"] * 100 / total["seconds"]
+                          if total["seconds"] else 0),
+                s["peak_bytes"] / 1024,
+                self._sizes(s["sizes"]) if name is not None else "")
+
+        if not units:
+            return
+        print >>fh
+        print >>fh, line % ("unit", "ms", "%", "peak kB", "sizes")
+        for name in sorted(units, key=lambda u: -units[u]["seconds"])[:top]:
+            u = units[name]
+            print >>fh, line % (
+                name[:24], "%.1f" % (u["seconds"] * 1000),
+                "%.1f" % (u["seconds"] * 100 / total["seconds"]
+                          if total["seconds"] else 0),
+                u["peak_bytes"] / 1024, self._sizes(u["sizes"]))
+        if len(units) > top:
+            print >>fh, "(%d more units)" % (len(units) - top)
+
+
+class NullProfile(object):
+    """
+    Profile recording nothing, for unprofiled builds.
+    """
+    @contextmanager
+    def unit(self, name):
+        yield
+
+    @contextmanager
+    def stage(self, name):
+        yield {}
+
+    def merge(self, records, unit):
+        pass
+
+NO_PROFILE = NullProfile()
@@ -0,0 +1,250 @@
+"""
+Binary DFA files and the generic lexer running them.
+
+Instead of a Python module, lang.py --binary writes the flat tables of the
+table backend into a versioned little-endian file:
+
+    header      magic "LANGDFA\\0", version, flags (1: bytes input), #states,
+                #classes, #bounds, #definitions, #cmap entries (uint32 each)
+    definitions id (int32), name length (uint16), name for each
+    arrays      bounds, range_class, cmap, trans, accept, next_start (int32)
+
+Loading is a few bulk reads into arrays. lexer() runs the table backend
+scanner, generated once per input mode and shared by every DFA; it returns
+the definition id of each token and runs no rules.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import struct
+import sys
+from array import array
+
+import pytable_codegen
+
+MAGIC          = "LANGDFA\0"
+FORMAT_VERSION = 1
+
+FLAG_BYTES = 1
+
+HEADER = struct.Struct("<8sIIIIIII")
+DEFN   = struct.Struct("<iH")
+
+ARRAYS = ("bounds", "range_class", "cmap", "trans", "accept", "next_start")
+
+class FormatError(Exception):
+    pass
+
+class LangException(Exception):
+    # Raised by lexer() on input no definition matches.
+    def __init__(self, line, message):
+        self.line = line
+        self.msg  = message
+
+    def __str__(self):
+        return self.msg + ":\n" + self.line
+
+def _int32(values):
+    a = array('i', values)
+    assert a.itemsize == 4
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+class DFA(object):
+    """
+    Tables of a lexer. definitions[k] is the id of the definition accepted
+    in states with accept k (definitions[0] is None) and names[id] its name.
+    """
+    def __init__(self, byte_input, nclasses, definitions, names,
+                 bounds, range_class, cmap, trans, accept, next_start):
+        self.byte_input  = byte_input
+        self.nclasses    = nclasses
+        self.definitions = definitions
+        self.names       = names
+        self.bounds      = bounds
+        self.range_class = range_class
+        self.cmap        = cmap
+        self.trans       = trans
+        self.accept      = accept
+        self.next_start  = next_start
+
+    @staticmethod
+    def from_tables(tables, ids, byte_input):
+        """
+        DFA of pytable_codegen.Tables, ids mapping definition names to ids.
+        """
+        definitions = [None] + [ids[d] for d in tables.definitions[1:]]
+        names       = dict(zip(definitions[1:], tables.definitions[1:]))
+        return DFA(byte_input, tables.nclasses, tuple(definitions), names,
+                   *[array('i', getattr(tables, name)) for name in ARRAYS])
+
+    def dumps(self):
+        nstates = len(self.accept)
+        out = [HEADER.pack(MAGIC, FORMAT_VERSION,
+                           FLAG_BYTES if self.byte_input else 0,
+                           nstates, self.nclasses, len(self.bounds),
+                           len(self.definitions) - 1, len(self.cmap))]
+        for d in self.definitions[1:]:
+            name = self.names[d]
+            out.append(DEFN.pack(d, len(name)) + name)
+        for name in ARRAYS:
+            out.append(_int32(getattr(self, name)).tostring())
+        return "".join(out)
+
+    def save(self, path):
+        with open(path, "wb") as fh:
+            fh.write(self.dumps())
+
+    @staticmethod
+    def loads(data):
+        if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise FormatError("Not a LANG DFA file")
+
+        (_, version, flags, nstates, nclasses, nbounds, ndefinitions,
+         ncmap) = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise FormatError("Unsupported LANG DFA format version %d "
+                              "(expected %d)" % (version, FORMAT_VERSION))
+
+        pos         = HEADER.size
+        definitions = [None]
+        names       = {}
+        for _ in range(ndefinitions):
+            d, n = DEFN.unpack_from(data, pos)
+            pos += DEFN.size
+            definitions.append(d)
+            names[d] = data[pos:pos+n]
+            pos += n
+
+        arrays = []
+        for n in (nbounds, nbounds, ncmap, nstates * nclasses, nstates,
+                  nstates):
+            a = array('i')
+            a.fromstring(data[pos:pos+4*n])
+            if len(a) != n:
+                raise FormatError("Truncated LANG DFA file")
+            if sys.byteorder == "big":
+                a.byteswap()
+            arrays.append(a)
+            pos += 4 * n
+
+        return DFA(bool(flags & FLAG_BYTES), nclasses, tuple(definitions),
+                   names, *arrays)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as fh:
+            return DFA.loads(fh.read())
+
+
+class _DefinitionRules(object):
+    # Rule table whose only rule returns the definition of the token.
+    @staticmethod
+    def _rule(lexer):
+        return lexer._yyid
+
+    def get(self, key):
+        return self._rule
+
+def _scanner(byte_input):
+    codegen = pytable_codegen.PyTableLangCodeGen(byte_input=byte_input)
+    env = {}
+    exec codegen.add_header("binary DFA") + codegen.common_code() in env
+    # One exception type for all scanners.
+    env["LangException"] = LangException
+    return env[codegen.class_name()]
+
+_SCANNERS = {}
+
+def lexer(dfa, input, bufsize=65536):
+    """
+    Lexer scanning input with dfa. nexttoken() returns definition ids.
+    """
+    if dfa.byte_input not in _SCANNERS:
+        scanner = _scanner(dfa.byte_input)
+
+        class _Lexer(scanner):
+            def __init__(self, dfa, input, bufsize):
+                self._nclasses    = dfa.nclasses
+                self._bounds      = dfa.bounds
+                self._range_class = dfa.range_class
+                self._definitions = dfa.definitions
+                self._cmap        = dfa.cmap
+                self._trans       = dfa.trans
+                self._accept      = dfa.accept
+                self._next_start  = dfa.next_start
+                self.names        = dfa.names
+                scanner.__init__(self, input, bufsize)
+
+            def install_transitions(self):
+                pass
+
+            def install_rules(self):
+                self._rules = _DefinitionRules()
+
+        _SCANNERS[dfa.byte_input] = _Lexer
+
+    return _SCANNERS[dfa.byte_input](dfa, input, bufsize)
+
+def tokenize_all(dfa, input, bufsize=65536):
+    """
+    Definition ids, starts and ends of all tokens of input as parallel
+    arrays.
+    """
+    return lexer(dfa, input, bufsize).tokenize_into(array('i'), array('l'),
+                                                   array('l'))
+
+def _failure(input, pos):
+    # LangException pointing at pos, like the generated lexers raise.
+    start  = max(input.rfind("\n", 0, pos), max(pos - 20, 0))
+    data   = input[start:pos+1]
+    return LangException(data + "\n" + ("-" * (pos - start)) + "^",
+                         "Failed to parse input at offset %d" % pos)
+
+def tokenize_lazy(rxs, ids, input):
+    """
+    tokenize_all() with regexes (lazy ones: regex.Regex(..., lazy=True)) in
+    place of a DFA: each token is the longest non-empty match of the first of
+    rxs that has one, with the id of its pattern in ids (a list per regex).
+    """
+    result = (array('i'), array('l'), array('l'))
+    pos = 0
+    n   = len(input)
+    while pos < n:
+        for rx, rx_ids in zip(rxs, ids):
+            match = rx.longest_accept(input, pos)
+            if match is not None and match[0] > pos:
+                break
+        else:
+            raise _failure(input, pos)
+        end, i = match
+        for a, v in zip(result, (rx_ids[i], pos, end)):
+            a.append(v)
+        pos = end
+    return result
+
+if __name__ == '__main__':
+    dfa = DFA.load(sys.argv[1])
+    sm  = lexer(dfa, sys.stdin if sys.argv[2] == '-' else open(sys.argv[2], "rb"))
+    while True:
+        d = sm.nexttoken()
+        if d is None:
+            break
+        print dfa.names[d], repr(sm.yytoken())
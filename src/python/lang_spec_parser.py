@@ -97,6 +97,16 @@ UNKNOWN     = Section("UNKNOWN", CONSTANTS)
 # ------------------------
 
 def parse(fn):
+    with open(fn) as fh:
+        return parse_lines(fh)
+
+def parse_text(text):
+    """
+    Parse a specification given as a string.
+    """
+    return parse_lines(text.splitlines())
+
+def parse_lines(lines):
     constants = {}
 
     definitions_order = []
@@ -108,68 +118,67 @@ def parse(fn):
 
     section = UNKNOWN
 
-    with open(fn) as fh:
-        for line in fh:
-            line = line.rstrip()
-            if not line or line.startswith("#"):
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+
+        if section is None:
+            raise "Bad state"
+        
+        if section.next and line.lstrip().lower().startswith(section.next.lcname):
+            section = section.next
+            info("Starting section: %s" % section)
+            continue
+        
+        if section == CONSTANTS:
+            m = CONSTANT_PATTERN.match(line)
+            if not m:
+                parse_warn(line)
                 continue
 
-            if section is None:
-                raise "Bad state"
-            
-            if section.next and line.lstrip().lower().startswith(section.next.lcname):
-                section = section.next
-                info("Starting section: %s" % section)
-                continue
-            
-            if section == CONSTANTS:
-                m = CONSTANT_PATTERN.match(line)
+            for c in CONSTANT_SPLIT_PATTERN.split(m.groups()[0]):
+                m = CONSTANT_KEY_VALUE_PATTERN.match(c)
                 if not m:
                     parse_warn(line)
                     continue
 
-                for c in CONSTANT_SPLIT_PATTERN.split(m.groups()[0]):
-                    m = CONSTANT_KEY_VALUE_PATTERN.match(c)
-                    if not m:
-                        parse_warn(line)
-                        continue
-
-                    ck = m.groups()[0]
-                    cv = m.groups()[1]
+                ck = m.groups()[0]
+                cv = m.groups()[1]
 
-                    constants[ck] = cv
-
-                continue
+                constants[ck] = cv
 
-            elif section == DEFINITIONS:
-                if definitions_order:
-                    m = CONT_DEFINITION_PATTERN.match(line)
-                    if m:
-                        defn = m.groups()[0]
-                        definitions[definitions_order[-1]].append(defn)
-                        info("Appending to def %s: %s" % (definitions_order[-1], defn))
-                        continue
+            continue
 
-                m = DEFINITION_PATTERN.match(line)
-                if not m:
-                    parse_warn(line)
-                    continue
-                last_defn = m.groups()[0]
-                defn      = m.groups()[1]
-                info("Adding def %s: %s" % (last_defn, defn))
-                definitions_order.append(last_defn)
-                definitions[last_defn] = [defn]
-
-            elif section == RULES:
-                m = RULE_PATTERN.match(line)
-                if not m:
-                    parse_warn(line)
+        elif section == DEFINITIONS:
+            if definitions_order:
+                m = CONT_DEFINITION_PATTERN.match(line)
+                if m:
+                    defn = m.groups()[0]
+                    definitions[definitions_order[-1]].append(defn)
+                    info("Appending to def %s: %s" % (definitions_order[-1], defn))
                     continue
 
-                rules[m.groups()[0]] = m.groups()[1]
+            m = DEFINITION_PATTERN.match(line)
+            if not m:
+                parse_warn(line)
+                continue
+            last_defn = m.groups()[0]
+            defn      = m.groups()[1]
+            info("Adding def %s: %s" % (last_defn, defn))
+            definitions_order.append(last_defn)
+            definitions[last_defn] = [defn]
+
+        elif section == RULES:
+            m = RULE_PATTERN.match(line)
+            if not m:
+                parse_warn(line)
+                continue
+
+            rules[m.groups()[0]] = m.groups()[1]
 
-            elif section == CODE:
-                code.append(line)
+        elif section == CODE:
+            code.append(line)
 
     return constants, [(i, definitions[i]) for i in definitions_order], rules, code
 
@@ -19,7 +19,12 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import logging
+import multiprocessing
+
+import lang_cache
 import lang_codegen
+import lang_profile
 import regex
 
 class Counter(object):
@@ -34,18 +39,52 @@ class Counter(object):
     def get(self):
         return self.i
 
+class DState(object):
+    """
+    A numbered DFA state as handed to LangCodeGen.transitions_fn.
+
+    edges is a list of (charset, next state), definition is the accepted
+    definition (None if not accepting) and next_start the start state to
+    fall back to when nothing (non-empty) is accepted. Accepting states have
+    one too: their definition may have matched the empty string.
+    """
+    def __init__(self, state, fn_name, edges, definition, next_start):
+        self.state      = state
+        self.fn_name    = fn_name
+        self.edges      = edges
+        self.definition = definition
+        self.next_start = next_start
+
+def _build_dfa(args):
+    # Pool worker: the CompiledDFA of a pattern and the profile records of
+    # its build.
+    pattern, minimize, max_char, profiled = args
+    profile = lang_profile.Profile() if profiled else None
+    dfa = lang_cache.CompiledDFA(regex.Regex(pattern, minimize, max_char,
+                                             profile and profile.stage))
+    return dfa, profile.records if profiled else []
+
 class Builder(object):
-    def __init__(self, code_gen):
+    def __init__(self, code_gen, minimize=True, cache=None, profile=None):
         assert isinstance(code_gen, lang_codegen.LangCodeGen)
-        self.codegen = code_gen
+        self.codegen  = code_gen
+        self.minimize = minimize
+        # lang_cache.DFACache, None to always build the DFAs.
+        self.cache    = cache
+        # lang_profile.Profile timing the stages.
+        self.profile  = profile or lang_profile.NO_PROFILE
+        self.max_char = regex.BYTE_MAX if code_gen.byte_input else regex.MAX_CHAR
 
         self.code = self.codegen.common_code()
         self.transitions = []
+        self.laststate   = 0
+        self.stats = {}
     
     def common_code(self):
         self.code += self.codegen.common_code()
 
-    def _dfa_state_matcher_gen(self, dfa_table, dfa_start, start_state, definition):
+    def _dfa_state_matcher_gen(self, rx, start_state, definitions,
+                               next_start=None):
         def _map(mapping, si, counter):
             if si not in mapping:
                 i = counter.postincr()
@@ -56,11 +95,13 @@ class Builder(object):
         counter = Counter(start_state)
         mapping = {}
 
-        _map(mapping, dfa_start, counter)
+        dfa_table = rx.dfa_table()
+        classes   = rx.classes()
+
+        _map(mapping, rx.dfa_start(), counter)
 
         transitions = {}
-        fail_states = {}
-        
+
         class_name = self.codegen.class_name()
 
         code = ""
@@ -69,58 +110,169 @@ class Builder(object):
             sij = _map(mapping, si, counter)
             row = dfa_table[si]
 
-            accepting = regex.MATCH_STATE.id in si
+            accepted   = rx.accepts(si)
+            accepting  = accepted is not None
+            definition = definitions[accepted] if accepting else None
 
-            code += self.codegen.match_fn_start(sij, len(row)>0)
+            code += self.codegen.match_fn_start(sij, len(row)>0, definition)
 
-            # Move . (any) to the end.
-            ordered_row = []
-            for r in row:
-                if r != regex.ANY:
-                    ordered_row.append(r)
-            ordered_row = sorted(ordered_row)
-            has_any = False
-            if regex.ANY in row:
-                has_any = True
-                ordered_row.append(regex.ANY)
+            # One condition per target state, on the union of the classes
+            # leading there.
+            targets = {}
+            for k, nextsi in row.items():
+                targets.setdefault(nextsi, []).extend(classes[k])
 
-            for k in ordered_row:
-                nextsi  = row[k]
+            edges = []
+            for cs, nextsi in sorted([(regex.charset(intervals), nextsi)
+                                      for nextsi, intervals in targets.items()]):
                 nextsij = _map(mapping, nextsi, counter)
+                edges.append((cs, nextsij))
 
-                code += self.codegen.match_fn_condition(k, nextsij)
+                code += self.codegen.match_fn_condition(cs, nextsij)
 
-            if not has_any:
-                code += self.codegen.match_fn_end(accepting, definition, len(row)>0)
+            code += self.codegen.match_fn_end(accepting, definition, len(row)>0)
 
             fn_name = "%s.%s" % (class_name, self.codegen.match_fn_name(sij))
-            transitions[sij] = fn_name
-            fail_states[sij] = not accepting
+            transitions[sij] = (fn_name, edges, definition)
 
-        for sij, fn_name in transitions.items():
-            self.transitions.append([sij, 
-                                     fn_name,
-                                     counter.get() if fail_states[sij] else None])
+        # Unless told otherwise, the next definition starts right after.
+        if next_start is None:
+            next_start = counter.get()
+
+        for sij, (fn_name, edges, definition) in transitions.items():
+            self.transitions.append(DState(sij,
+                                           fn_name,
+                                           edges,
+                                           definition,
+                                           next_start))
 
         return code, counter.get()
 
     def build(self, laststate):
-        self.code += self.codegen.transitions_fn(self.transitions, laststate)
+        self.laststate = laststate
+        with self.profile.stage("transitions") as sizes:
+            code = self.codegen.transitions_fn(self.transitions, laststate)
+            sizes["code_bytes"] = len(code)
+        self.code += code
 
         return self.code
 
-    def add_regex(self, r, start_state, definition):
-        r2 = regex.Regex(r)
-
-        code, next_state = self._dfa_state_matcher_gen(r2.dfa_table(),
-                                                       r2.dfa_start(),
-                                                       start_state,
-                                                       definition)
+    def _add_stats(self, name, r):
+        stats = r.stats()
+        for k, v in stats.items():
+            self.stats[k] = self.stats.get(k, 0) + v
+        logging.info("%s: %s" % (name, " ".join(["%s=%d" % (k, stats[k])
+                                                   for k in sorted(stats)])))
+
+    def _parts(self, *parts):
+        # Cache key parts.
+        return parts + (self.minimize, self.max_char)
+
+    def _compile(self, build, *parts):
+        if self.cache is None:
+            return build()
+        return self.cache.dfa(build, *self._parts(*parts))
+
+    def regex(self, r):
+        return self._compile(lambda: regex.Regex(r, self.minimize, self.max_char,
+                                                 self.profile.stage),
+                             "regex", r)
+
+    def regex_set(self, patterns):
+        return self._compile(lambda: regex.RegexSet(patterns, self.minimize,
+                                                    self.max_char,
+                                                    self.profile.stage),
+                             "regexset", tuple(patterns))
+
+    def regexes(self, patterns, names, processes=1):
+        """
+        regex(r) of every pattern, names labelling their profiles. With
+        several processes (None for one per CPU), the DFAs missing from the
+        cache are built by a process pool; they come back as CompiledDFAs,
+        which generate the same code.
+        """
+        if processes == 1 or len(patterns) <= 1:
+            rxs = []
+            for name, r in zip(names, patterns):
+                with self.profile.unit(name):
+                    rxs.append(self.regex(r))
+            return rxs
+
+        rxs  = [None] * len(patterns)
+        todo = []
+        for i, r in enumerate(patterns):
+            if self.cache is not None:
+                rxs[i] = self.cache.get(self.cache.key(*self._parts("regex", r)))
+            if rxs[i] is None:
+                todo.append(i)
+
+        profiled = not isinstance(self.profile, lang_profile.NullProfile)
+        pool = multiprocessing.Pool(processes)
+        try:
+            built = pool.map(_build_dfa, [(patterns[i], self.minimize,
+                                           self.max_char, profiled)
+                                          for i in todo])
+        finally:
+            pool.terminate()
+
+        for i, (dfa, records) in zip(todo, built):
+            self.profile.merge(records, names[i])
+            if self.cache is not None:
+                self.cache.put(self.cache.key(*self._parts("regex",
+                                                           patterns[i])), dfa)
+            rxs[i] = dfa
+        return rxs
+
+    @staticmethod
+    def dfa_size(rx):
+        """
+        Number of states _dfa_state_matcher_gen numbers for rx.
+        """
+        states = set(rx.dfa_table())
+        states.add(rx.dfa_start())
+        for row in rx.dfa_table().values():
+            states.update(row.values())
+        return len(states)
+
+    def add_dfa(self, rx, start_state, definitions, next_start=None):
+        """
+        Add the states of rx numbered from start_state. next_start is the
+        start state to fall back to when nothing is accepted, by default the
+        state right after the last one of rx.
+        """
+        self._add_stats(",".join(map(str, definitions)), rx)
+
+        with self.profile.stage("matcher_gen") as sizes:
+            code, next_state = self._dfa_state_matcher_gen(rx,
+                                                           start_state,
+                                                           definitions,
+                                                           next_start)
+            sizes["states"]     = next_state - start_state
+            sizes["code_bytes"] = len(code)
 
         self.code += code
 
         return next_state
 
+    def add_built(self, code, transitions):
+        """
+        Add states generated by an earlier build.
+        """
+        self.code += code
+        self.transitions.extend(transitions)
+
+    def add_regex(self, r, start_state, definition):
+        return self.add_dfa(self.regex(r), start_state, [definition])
+
+    def add_regexes(self, patterns, start_state, definitions):
+        """
+        Build one combined DFA for all patterns. When a state accepts several
+        patterns, the definition listed first wins.
+        """
+        assert len(patterns) == len(definitions)
+
+        return self.add_dfa(self.regex_set(patterns), start_state, definitions)
+
 
 if __name__ == '__main__':
     import sys
@@ -130,5 +282,5 @@ if __name__ == '__main__':
 
     builder = Builder(pylang_codegen.PyLangCodeGen())
     nextstate = 0
-    nextstate = builder.add_regex(sys.argv[1], nextstate)
+    nextstate = builder.add_regex(sys.argv[1], nextstate, 1)
     print builder.build(nextstate)
@@ -24,10 +24,44 @@ import lang_codegen
 import regex
 
 class PyLangCodeGen(lang_codegen.LangCodeGen):
-    def __init__(self):
-        pass
+    def __init__(self, byte_input=False, spans=False, instrument=False):
+        self.byte_input = byte_input
+        self.max_char   = regex.BYTE_MAX if byte_input else regex.MAX_CHAR
+        # Keep only token offsets; yytoken() slices the text on demand.
+        self.spans      = spans
+        # Count what the lexer does (see stats_code).
+        self.instrument = instrument
+        # Some rule is keyed by the text of its tokens rather than by a
+        # definition: matched() looks the text up too.
+        self.text_rules = False
 
     def common_code(self):
+        return self.lexer_code() + self.scanner_code()
+
+    def counting(self, lines, indent=8):
+        """
+        lines of code, each on a line of its own indented by indent spaces,
+        in instrumented lexers; nothing otherwise: uninstrumented lexers
+        carry no trace of the counters.
+        """
+        if not self.instrument:
+            return ""
+        return "".join(["\n" + " " * indent + line for line in lines])
+
+    @staticmethod
+    def count(counter, key, n=None):
+        """
+        Statement adding n (1 by default) to the count of key in counter.
+        """
+        if n is None:
+            return 'self._count("%s", %s)' % (counter, key)
+        return 'self._count("%s", %s, %s)' % (counter, key, n)
+
+    def lexer_code(self):
+        """
+        Exception and lexer class with the input handling and token API
+        shared by all Python backends.
+        """
         return """
 class LangException(Exception):
     def __init__(self, line, message):
@@ -38,8 +72,10 @@ class LangException(Exception):
         return self.msg + ":\\n" + self.line
 
 class %s(object):
-    def __init__(self, input):
-        self.input        = input
+    def __init__(self, input, bufsize=65536):
+%s
+        self._bufsize     = bufsize
+        self.offset       = 0
         self.input_index  = 0
         self.lexeme_begin = 0
         self.start_state  = 0
@@ -47,8 +83,16 @@ class %s(object):
         self._yystart     = 0
         self._yyend       = 0
         self._yytoken     = None
+        # matched() slices the text of each token, unless tokenize_into()
+        # runs no rules.
+        self._yyslice     = True
         self._yyid        = None
         self._yynum       = None
+        # Longest match seen so far for the current token.
+        self._last_accept = None
+        self._last_index  = 0
+        # End of the text looked at for the current token.
+        self._yyscan      = 0
 
         self.table = []
         self.install_transitions()
@@ -56,23 +100,53 @@ class %s(object):
         self._rules = {}
         self.install_rules()
 
-        self.user_variables = {}
+        self.user_variables = {}%s
 
-    def put_table(self, state, fn, next_start=None):
-        if state >= len(self.table):
-            for i in range(len(self.table), state+8):
-                self.table.append(None)
-        self.table[state] = [fn, next_start]
+    @staticmethod
+    def _read_chunks(input, bufsize):
+        if not hasattr(input, "read"):
+            for chunk in input:
+                yield chunk
+            return
+        while True:
+            chunk = input.read(bufsize)
+            if not chunk:
+                return
+            yield chunk
+
+    def _refill(self):
+        # Append the next chunk to the buffer, dropping what was consumed
+        # before the current token (but for some context for error messages).
+        # Returns the number of chars dropped, None at the end of input.
+        if self._chunks is None:
+            return None
+        for chunk in self._chunks:
+            if chunk:
+                break
+        else:
+            self._chunks = None
+            return None
+
+        shift = max(self.lexeme_begin - 20, 0)
+        self.input         = self.input[shift:] + chunk
+        self.offset       += shift
+        self.input_index  -= shift
+        self.lexeme_begin -= shift
+        self._last_index  -= shift
+        return shift
 
     def raise_exception(self):
         start  = max(self.input_index - 20, 0)
-        data   = self.input[start:self.input_index+1]
+        data   = %s
         start  = max(start, data.rfind("\\n"))
         length = min(self.input_index, len(self.input)) + 1 - start
         data   = data + "\\n" + ("-" * (length-1)) + "^"
-        raise LangException(data, "Failed to parse input")
+        raise LangException(data, "Failed to parse input at offset %%d" %%
+                            (self.offset + self.input_index))
 
     def nextchar(self):
+        if self.input_index >= len(self.input):
+            self._refill()
         if self.input_index > len(self.input):
             self.raise_exception()
         i = self.input_index
@@ -82,13 +156,186 @@ class %s(object):
         return None
 
     def eof(self):
-        return self.input_index >= len(self.input)
+        if self.input_index < len(self.input):
+            return False
+        return self._refill() is None
 
     def retract(self, n=1):
         self.input_index -= n
         if self.input_index < 0:
             self.input_index = 0
 
+    def yystart(self):
+        return self._yystart
+
+    def yyend(self):
+        return self._yyend
+
+    def yyspan(self):
+        return self._yystart, self._yyend
+%s
+    def matched(self, definition):
+        self.curr_state  = 0
+        self.start_state = 0
+        self._last_accept = None
+        self._yyid        = definition
+
+        self._yystart = self.offset + self.lexeme_begin
+        self._yyend   = self.offset + self.input_index
+        %s%s
+
+        self.lexeme_begin = self.input_index
+
+        rule = self._rules.get(definition)%s
+        if rule:
+            return rule(self)
+        return
+%s""" % (self.class_name(), self.input_code(),
+       self.counting(["self._stats = dict([(counter, {}) "
+                      "for counter in self.COUNTERS])"]),
+       self.slice_code("start", "self.input_index+1"),
+       self.token_code(),
+       "self._yytoken = None" if self.spans else
+       "self._yytoken = %s if self._yyslice else None" %
+       self.slice_code("self.lexeme_begin", "self.input_index"),
+       self.counting([self.count("tokens", "definition"),
+                      self.count("token_chars", "definition",
+                                 "self._yyend - self._yystart")]),
+       self.text_rule_code(),
+       self.stats_code() if self.instrument else "")
+
+    def text_rule_code(self):
+        if not self.text_rules:
+            return ""
+        return """
+        if not rule:
+            rule = self._rules.get(%s)""" % (
+            "self.yytoken()" if self.spans else "self._yytoken")
+
+    def stats_code(self):
+        """
+        Counters of instrumented lexers.
+        """
+        return """
+    # Instrumentation counters, each mapping a state or a definition to a
+    # count: chars consumed in each state, restarts at the next start state
+    # after each start state failed, chars read past the end of the token
+    # (the one that ended it aside) and given back for each start state,
+    # tokens and their chars for each definition, and rule invocations for
+    # the definition of each token.
+    COUNTERS = ("chars", "fails", "retracts", "tokens", "token_chars", "rules")
+
+    def _count(self, counter, key, n=1):
+        if n:
+            counts = self._stats[counter]
+            counts[key] = counts.get(key, 0) + n
+
+    def stats(self):
+        # Snapshot of the counters.
+        return dict([(counter, dict(counts))
+                     for counter, counts in self._stats.items()])
+
+    def reset_stats(self):
+        # In place: running scanners may hold on to the counts.
+        for counts in self._stats.values():
+            counts.clear()
+"""
+
+    def slice_code(self, begin, end):
+        """
+        Expression of the input from begin to end as a string.
+        """
+        if self.byte_input:
+            # Slices of memoryviews are views: copy them out.
+            return "(self.input[%s:%s].tobytes() if self._view else " \
+                   "self.input[%s:%s])" % (begin, end, begin, end)
+        return "self.input[%s:%s]" % (begin, end)
+
+    def token_code(self):
+        """
+        Token text accessors.
+        """
+        code = """
+    def yytoken(self):
+        return self._yytoken
+"""
+        if self.spans:
+            code = """
+    def yytoken(self):
+        # Sliced on first use; valid until the next call to nexttoken().
+        if self._yytoken is None:
+            self._yytoken = %s
+        return self._yytoken
+""" % self.slice_code("self._yystart - self.offset",
+                      "self._yyend - self.offset")
+        if self.byte_input:
+            code += """
+    def yyview(self):
+        # Zero-copy view of the token; valid until the next call to
+        # nexttoken().
+        if self._view:
+            return self.input[self._yystart - self.offset:
+                              self._yyend - self.offset]
+        return buffer(self.input, self._yystart - self.offset,
+                      self._yyend - self._yystart)
+"""
+        return code
+
+    def input_code(self):
+        """
+        Body of __init__ setting up self.input and self._chunks.
+        """
+        if self.byte_input:
+            return """\
+        # input is a byte string, an mmap, a memoryview or another buffer
+        # object scanned in place, a file (memory mapped) or an iterator of
+        # byte chunks.
+        self._chunks = None
+        self._view   = isinstance(input, memoryview)
+        if isinstance(input, (str, mmap.mmap)):
+            self.input = input
+        elif isinstance(input, memoryview):
+            # Indexed in place: input[i] is a char.
+            assert input.itemsize == 1
+            self.input = input
+        elif hasattr(input, "fileno"):
+            try:
+                self.input = mmap.mmap(input.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                # Pipes and empty files cannot be mapped: stream them.
+                self.input   = ""
+                self._chunks = self._read_chunks(input, bufsize)
+        else:
+            try:
+                self.input = buffer(input)
+            except TypeError:
+                self.input   = ""
+                self._chunks = self._read_chunks(input, bufsize)"""
+
+        return """\
+        # input is a string, a file object or an iterator of chunks. For the
+        # last two, self.input is a sliding buffer holding the current token
+        # and what has been read past it; offset is the position of its first
+        # char in the whole input.
+        if isinstance(input, basestring):
+            self.input   = input
+            self._chunks = None
+        else:
+            self.input   = input.read(0) if hasattr(input, "read") else ""
+            self._chunks = self._read_chunks(input, bufsize)"""
+
+    def scanner_code(self):
+        """
+        Scanner driving one generated method per DFA state.
+        """
+        return """
+    def put_table(self, state, fn, next_start=None):
+        if state >= len(self.table):
+            for i in range(len(self.table), state+8):
+                self.table.append(None)
+        self.table[state] = [fn, next_start]
+
     def get_transition(self, state):
         return self.table[state][0]
 
@@ -112,37 +359,71 @@ class %s(object):
             if retval is not None:
                 return retval
 
-    def yystart(self):
-        return self._yystart
-
-    def yyend(self):
-        return self._yyend
+    def accept(self, definition):
+        self._last_accept = definition
+        self._last_index  = self.input_index
 
-    def yytoken(self):
-        return self._yytoken
-
-    def matched(self, definition):
-        self.curr_state  = 0
-        self.start_state = 0
+    def dead(self):
+        if self.offset + self.input_index > self._yyscan:
+            self._yyscan = self.offset + self.input_index
 
-        self._yystart = self.lexeme_begin
-        self._yyend   = self.input_index
-        self._yytoken = self.input[self._yystart:self._yyend]
+        # No transition: roll back to the last accepting position, or try the
+        # next start state if nothing (non-empty) was accepted.
+        if self._last_accept is None or self._last_index == self.lexeme_begin:
+            self.curr_state = self.fail()
+            return%s
+        self.input_index = self._last_index
+        return self.matched(self._last_accept)
 
-        self.lexeme_begin = self.input_index
-
-        rule = self._rules.get(definition)
-        if not rule:
-            rule = self._rules.get(self._yytoken)
-        if rule:
-            return rule(self)
-        return
-
-    def fail(self):
+    def fail(self):%s
+        self._last_accept = None
         self.input_index = self.lexeme_begin
         self.start_state = self.get_next_state(self.start_state)
         return self.start_state
-""" % self.class_name()
+
+    class _DefinitionRules(object):
+        # Rule table whose only rule returns the definition of the token.
+        @staticmethod
+        def _rule(lexer):
+            return lexer._yyid
+
+        def get(self, key):
+            return self._rule
+
+    def tokenize_into(self, ids, starts, ends, stop=None, lookaheads=None):
+        # Append the definition, start and end of every remaining token (up
+        # to the first one starting at or after stop) to ids, starts and ends
+        # (e.g. arrays) without running the rules. lookaheads gets the end of
+        # the text looked at to find each token.
+        rules = self._rules
+        self._rules   = self._DefinitionRules()
+        self._yyslice = False
+        try:
+            while True:
+                if stop is not None and \\
+                        self.offset + self.lexeme_begin >= stop:
+                    return ids, starts, ends
+                definition = self.nexttoken()
+                if definition is None:
+                    return ids, starts, ends
+                ids.append(definition)
+                starts.append(self._yystart)
+                ends.append(self._yyend)
+                if lookaheads is not None:
+                    lookaheads.append(max(self._yyscan, self._yyend))
+                self._yyscan = 0
+        finally:
+            self._rules   = rules
+            self._yyslice = True
+""" % (self.counting([self.count("retracts", "self.start_state",
+                                  "self.input_index - 1 - self._last_index")]),
+       self.counting(["# Nothing left to read: the end of input, not a "
+                      "failure.",
+                      "if self.lexeme_begin < len(self.input):"]) +
+       self.counting([self.count("fails", "self.start_state"),
+                      self.count("retracts", "self.start_state",
+                                 "self.input_index - 1 - self.lexeme_begin")],
+                     12))
 
     def class_name(self):
         return "PyLexer"
@@ -150,62 +431,83 @@ class %s(object):
     def match_fn_name(self, state):
         return "match_%d" % state
 
-    def match_fn_start(self, state, has_conditions=True):
+    def match_fn_start(self, state, has_conditions=True, definition=None):
         code = """
     def %s(self):
 """ % self.match_fn_name(state)
 
         if has_conditions:
+            if definition is not None:
+                code += """
+        self.accept(%s)
+""" % definition
+
             code += """
         c = self.nextchar()
 """
 
         return code
 
-    def match_fn_condition(self, c, nextstate):
-        if c != regex.ANY:
-            return """
-        if c == '%s':
+    def char_literal(self, o):
+        return repr(chr(o)) if o < 0x80 or self.byte_input else repr(unichr(o))
+
+    def match_fn_condition(self, intervals, nextstate):
+        # c is None at end of input; None compares below any char.
+        tests = []
+        for lo, hi in intervals:
+            if lo == hi:
+                tests.append("c == %s" % self.char_literal(lo))
+            elif hi == self.max_char:
+                tests.append("c >= %s" % self.char_literal(lo))
+            else:
+                tests.append("%s <= c <= %s" % (self.char_literal(lo),
+                                                self.char_literal(hi)))
+
+        return """
+        if %s:%s
             self.curr_state = %d
             return
-""" % (c, nextstate)
-        else:
-            return """
-        self.curr_state = %d
-        return
-""" % nextstate
+""" % (" or ".join(tests),
+       self.counting([self.count("chars", "self.curr_state")], 12), nextstate)
 
-    def match_fn_end(self, accepting, definition, should_retract=True):
-        if accepting:
+    def match_fn_end(self, accepting, definition, has_conditions=True):
+        if accepting and not has_conditions:
             return """
-        %s
         return self.matched(%s)
-""" % ("self.retract()" if should_retract else "", definition)
+""" % definition
         else:
             return """
-        %s
-        self.curr_state = self.fail()
-""" % ("self.retract()" if should_retract else "")
+        return self.dead()
+"""
 
     def transitions_fn(self, transitions, laststate):
         code = """
     def install_transitions(self):
 """
-        for state, fn, nextstate in transitions:
+        for t in transitions:
+            nextstate = t.next_start
             code += """
         self.put_table(%d, %s, %s)
-""" % (state, fn, nextstate if nextstate != laststate else None)
+""" % (t.state, t.fn_name, nextstate if nextstate != laststate else None)
 
         return code
 
     def add_main(self):
         return """
+def tokenize_all(input, bufsize=65536):
+    \"\"\"
+    Definitions, starts and ends of all tokens of input as parallel arrays.
+    Rules are not run.
+    \"\"\"
+    return %s(input, bufsize).tokenize_into(array('i'), array('l'), array('l'))
+
 if __name__ == '__main__':
     import sys
-    sm = %s(sys.argv[1])
+    # '-' lexes standard input as a stream.
+    sm = %s(sys.stdin if sys.argv[1] == '-' else sys.argv[1])
     while not sm.eof():
         print sm.nexttoken(), sm.yytoken()
-""" % self.class_name()
+""" % (self.class_name(), self.class_name())
 
     def add_header(self, spec):
         return """
@@ -214,7 +516,11 @@ Lexical analyzer.
 
 Generated from '%s' by LANG.
 \"\"\"
-""" % spec
+""" % spec + """
+from array import array
+""" + ("""
+import mmap
+""" if self.byte_input else "")
 
     def add_constants(self, constants):
         code = """
@@ -250,9 +556,9 @@ Generated from '%s' by LANG.
             m[rule] = fn_name
 
             code += """
-    def %s(self):
+    def %s(self):%s
         %s
-""" % (fn_name, c)
+""" % (fn_name, self.counting([self.count("rules", "self._yyid")]), c)
 
         if rules:
             code += """
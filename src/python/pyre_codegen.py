@@ -0,0 +1,267 @@
+"""
+Python implementation of LangCodeGen on top of the re module.
+
+All definitions are translated into one master pattern with a named group
+per definition, tried in spec order. The C regex engine does the per char
+work; the generated PyLexer keeps the usual API.
+
+re picks the first alternative that matches (leftmost-first) and backtracks
+greedily instead of taking the longest match. Definitions whose meaning may
+change because of that (alternations and quantified groups) are reported.
+re cannot tell either whether a match would go on past the end of a buffer:
+these lexers do not stream, the input is always scanned whole.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import re
+
+import pylang_codegen
+import regex
+
+# Groups per re pattern (re allows at most 100).
+MAX_GROUPS = 99
+
+# Chars escaped inside a [...] class.
+CLASS_SPECIAL = "\\]^-["
+
+def _re_char(o, special, max_char):
+    # Text above ASCII is unicode: a str of one byte would not mix with it.
+    c = chr(o) if o < 0x80 or max_char == regex.BYTE_MAX else unichr(o)
+    return "\\" + c if c in special else c
+
+def _re_charset(cs, max_char):
+    if cs == regex.any_char(max_char):
+        return "."
+
+    negated = cs and cs[-1][1] == max_char
+    if negated:
+        cs = regex.negate(cs, max_char)
+        if not cs:
+            return "[\\s\\S]"
+
+    if not negated and len(cs) == 1 and cs[0][0] == cs[0][1]:
+        return _re_char(cs[0][0], ".^$*+?{}[]\\|()", max_char)
+
+    def char(o):
+        return _re_char(o, CLASS_SPECIAL, max_char)
+
+    return "[%s%s]" % ("^" if negated else "",
+                       "".join([char(lo) if lo == hi else
+                                "%s-%s" % (char(lo), char(hi))
+                                for lo, hi in cs]))
+
+def to_re(pattern, max_char=regex.MAX_CHAR):
+    """
+    Translate a LANG pattern into re syntax.
+
+    Returns (re pattern, exact) where exact is False if leftmost-first
+    backtracking may pick a different match than the DFA (longest match).
+    """
+    out   = []
+    exact = True
+    prev  = None
+
+    for t in regex.transform(pattern, max_char):
+        if t == '(':
+            out.append("(?:")
+        elif t == '|':
+            exact = False
+            out.append(t)
+        elif t in ('*', '+', '?'):
+            if prev == ')':
+                exact = False
+            out.append(t)
+        elif t == ')':
+            out.append(t)
+        else:
+            out.append(_re_charset(t, max_char))
+        prev = t if not isinstance(t, tuple) else None
+
+    return "".join(out), exact
+
+
+class PyReLangCodeGen(pylang_codegen.PyLangCodeGen):
+    needs_dfa = False
+
+    def __init__(self, **options):
+        pylang_codegen.PyLangCodeGen.__init__(self, **options)
+        # Definitions whose semantics may differ from the DFA backends.
+        self.inexact = []
+
+    def add_header(self, spec):
+        return pylang_codegen.PyLangCodeGen.add_header(self, spec) + """
+import re
+"""
+
+    def input_code(self):
+        """
+        Body of __init__ setting up self.input. re cannot tell whether a
+        match would go on past the end of a buffer, so streams are refused:
+        the input is always scanned whole.
+        """
+        if self.byte_input:
+            return """\
+        # input is a byte string, an mmap or another buffer object scanned in
+        # place, or a file (memory mapped).
+        self._chunks = None
+        self._view   = False
+        if isinstance(input, (str, mmap.mmap)):
+            self.input = input
+        elif isinstance(input, memoryview):
+            # re does not take memoryviews.
+            self.input = input.tobytes()
+        elif hasattr(input, "fileno"):
+            try:
+                self.input = mmap.mmap(input.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file.
+                self.input = ""
+            except EnvironmentError:
+                raise TypeError("re backend lexers cannot stream: %r cannot "
+                                "be memory mapped" % input)
+        else:
+            try:
+                self.input = buffer(input)
+            except TypeError:
+                raise TypeError("re backend lexers cannot stream: pass the "
+                                "whole input as a buffer")"""
+
+        return """\
+        # input is a string: re backend lexers cannot stream.
+        if not isinstance(input, basestring):
+            raise TypeError("re backend lexers cannot stream: pass the whole "
+                            "input as a string")
+        self.input   = input
+        self._chunks = None"""
+
+    def scanner_code(self):
+        """
+        Scanner matching the master pattern at the start of each token.
+        """
+        return """
+    # Inputs are scanned whole, never streamed.
+    streams = False
+""" + self.scan_fn("nexttoken", "", "None", """
+            self.input_index = m.end()
+            retval = self.matched(self._definitions[m.lastgroup])
+            if retval is not None:
+                return retval
+""") + self.scan_fn("tokenize_into",
+                   ", ids, starts, ends, stop=None, lookaheads=None",
+                   "ids, starts, ends", """
+            # Record the token without running any rule.%s
+            ids.append(self._definitions[m.lastgroup])
+            starts.append(self.offset + begin)
+            ends.append(self.offset + m.end())
+            if lookaheads is not None:
+                # re does not tell how far it looked: assume up to the end.
+                lookaheads.append(self.offset + len(input) + 1)
+            self.lexeme_begin = self.input_index = m.end()
+""" % self.counting([
+               self.count("tokens", "self._definitions[m.lastgroup]"),
+               self.count("token_chars", "self._definitions[m.lastgroup]",
+                          "m.end() - begin")], 12), on_begin="""
+            if stop is not None and self.offset + begin >= stop:
+                return ids, starts, ends""")
+
+    def scan_fn(self, name, args, at_end, on_token, on_begin=""):
+        """
+        Method matching token after token until on_begin or on_token returns
+        or the input ends (returning at_end).
+        """
+        return """
+    def %s(self%s):
+        input = self.input
+        match = self._match
+
+        while True:
+            begin = self.lexeme_begin%s
+            if begin >= len(input):
+                return %s
+
+            m = match(input, begin)
+            # A definition matching the empty string gives way to the ones
+            # after it, as in the DFA backends.
+            while m is not None and m.end() == begin and \\
+                    m.lastgroup in self._after:
+                m = self._after[m.lastgroup](input, begin)
+            if m is None or m.end() == begin:
+                self.input_index = begin
+                self.raise_exception()
+%s""" % (name, args, on_begin, at_end, on_token)
+
+    def patterns_fn(self, definitions):
+        groups = []
+        for defn, pattern in definitions:
+            p, exact = to_re(pattern, self.max_char)
+            if not exact:
+                logging.warn("%s: '%s' may match differently with re "
+                             "(leftmost-first instead of longest match)"
+                             % (defn, pattern))
+                self.inexact.append(defn)
+            groups.append("(?P<%s>%s)" % (defn, p))
+
+        code = ""
+        if self.inexact:
+            code += """
+    # Inexact translation (re is leftmost-first, not longest match): %s
+""" % ", ".join(self.inexact)
+
+        code += """
+    _match       = staticmethod(%s)
+""" % self.matcher(groups, "        ")
+
+        # Definitions that match the empty string are skipped when they do.
+        after = []
+        for i, (defn, pattern) in enumerate(definitions):
+            if re.match(to_re(pattern, self.max_char)[0], "") is not None:
+                after.append("\n        %r : %s," % (
+                    defn, self.matcher(groups[i+1:], "            ")))
+        code += """
+    _after       = {%s}
+
+    _definitions = { %s }
+
+    def install_transitions(self):
+        pass
+""" % ("".join(after) + ("\n    " if after else ""), ", ".join(["%r : %s" % (defn, defn)
+                                   for defn, _ in definitions]))
+
+        return code
+
+    @staticmethod
+    def matcher(groups, indent):
+        """
+        Expression matching the first of groups at a position, None if
+        none of them does.
+        """
+        if not groups:
+            return "lambda input, pos: None"
+        if len(groups) <= MAX_GROUPS:
+            return "re.compile(%r).match" % "|".join(groups)
+        # Try the chunks in turn: still the first definition that matches.
+        return """(lambda input, pos, masters=(%s):
+%s    next((m for m in (p.match(input, pos) for p in masters) if m),
+%s         None))""" % ("".join(["\n%s    re.compile(%r)," % (
+                                      indent, "|".join(groups[i:i+MAX_GROUPS]))
+                                  for i in range(0, len(groups), MAX_GROUPS)]),
+                        indent, indent)
@@ -0,0 +1,247 @@
+"""
+Table driven Python implementation of LangCodeGen.
+
+Instead of one method per DFA state, the DFA is emitted as flat arrays:
+a char to class map, a transition table indexed by state * #classes + class,
+an accept table and the next start state of each state. One loop over local
+variables in nexttoken() does the scanning.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+
+import pylang_codegen
+import regex
+
+# Chars below this are looked up in the flat class map, the rest by bisect.
+CMAP_SIZE = 256
+
+class Tables(object):
+    """
+    Flat DFA tables built from the DStates collected by the Builder.
+    """
+    def __init__(self, transitions, laststate):
+        nstates = laststate
+
+        charsets = sorted(set([cs for t in transitions for cs, _ in t.edges]))
+        classes, self.bounds, range_class, members = regex.alphabet(charsets)
+
+        self.nclasses    = len(classes)
+        self.range_class = [-1 if k is None else k for k in range_class]
+        self.cmap        = [self.char_class(o) for o in range(CMAP_SIZE)]
+
+        class_map = dict(zip(charsets, members))
+
+        self.definitions = [None]
+        index = {}
+
+        self.trans      = [-1] * (nstates * self.nclasses)
+        self.accept     = [0] * nstates
+        self.next_start = [-1] * nstates
+
+        for t in sorted(transitions, key=lambda t: t.state):
+            base = t.state * self.nclasses
+            for cs, nextstate in t.edges:
+                for k in class_map[cs]:
+                    self.trans[base + k] = nextstate
+
+            if t.definition is not None:
+                if t.definition not in index:
+                    index[t.definition] = len(self.definitions)
+                    self.definitions.append(t.definition)
+                self.accept[t.state] = index[t.definition]
+
+            if t.next_start is not None and t.next_start != laststate:
+                self.next_start[t.state] = t.next_start
+
+    def char_class(self, o):
+        k = bisect.bisect_right(self.bounds, o) - 1
+        return self.range_class[k] if k >= 0 else -1
+
+
+class PyTableLangCodeGen(pylang_codegen.PyLangCodeGen):
+    def __init__(self, **options):
+        pylang_codegen.PyLangCodeGen.__init__(self, **options)
+
+    def add_header(self, spec):
+        return pylang_codegen.PyLangCodeGen.add_header(self, spec) + """
+import bisect
+"""
+
+    def scanner_code(self):
+        """
+        Scanner driving the flat tables emitted by transitions_fn.
+        """
+        return """
+    def char_class(self, o):
+        k = bisect.bisect_right(self._bounds, o) - 1
+        return self._range_class[k] if k >= 0 else -1
+""" + self.scan_fn("nexttoken", "", "None", """
+                self.input_index = last_i
+                retval = self.matched(self._definitions[last])
+                if retval is not None:
+                    return retval
+                continue
+""") + self.scan_fn("tokenize_into",
+                   ", ids, starts, ends, stop=None, lookaheads=None",
+                   "ids, starts, ends", """
+                # Record the token without running any rule.%s
+                ids.append(self._definitions[last])
+                starts.append(self.offset + begin)
+                ends.append(self.offset + last_i)
+                if lookaheads is not None:
+                    lookaheads.append(far)
+                    far = 0
+                self.lexeme_begin = self.input_index = last_i
+                self.start_state  = 0
+                continue
+""" % self.counting([
+                 self.count("tokens", "self._definitions[last]"),
+                 self.count("token_chars", "self._definitions[last]",
+                            "last_i - begin")], 16), init="""
+        far      = 0""", on_begin="""
+            if stop is not None and self.offset + begin >= stop:
+                return ids, starts, ends""", on_scan="""
+            # Everything up to input[i] (or the end of input) was looked at.
+            if lookaheads is not None and self.offset + i >= far:
+                far = self.offset + i + 1
+""")
+
+    def scan_fn(self, name, args, at_end, on_token, init="", on_begin="",
+                on_scan=""):
+        """
+        Method running the DFA token after token until on_begin or on_token
+        returns or the input ends (returning at_end).
+        """
+        return """
+    def %s(self%s):
+        input    = self.input
+        n        = len(input)
+        cmap     = self._cmap
+        trans    = self._trans
+        accept   = self._accept
+        nclasses = self._nclasses%s%s
+
+        while True:
+            begin = self.lexeme_begin%s
+            if begin >= n:
+                if self._refill() is None:
+                    return %s
+                input = self.input
+                n     = len(input)
+                continue
+
+            start  = self.start_state
+            state  = start
+            i      = begin
+            last   = 0
+            last_i = begin
+
+            # Run the DFA as far as it goes, remembering the last accepting
+            # position.
+            while True:
+                if accept[state]:
+                    last   = accept[state]
+                    last_i = i
+                if i >= n:
+                    # Out of buffered input: read more and carry on.
+                    shift = self._refill()
+                    if shift is None:
+                        break
+                    begin  -= shift
+                    i      -= shift
+                    last_i -= shift
+                    input   = self.input
+                    n       = len(input)
+                %s
+                if k < 0:
+                    break%s
+                state = trans[state * nclasses + k]
+                if state < 0:
+                    break%s
+                i += 1
+%s
+            if last and last_i > begin:%s%s
+            # Nothing matched: try the next start state.%s
+            self.input_index = begin
+            self.start_state = self._next_start[start]
+            if self.start_state < 0:
+                self.start_state = 0
+                self.raise_exception()
+""" % (name, args, self.counting(['chars    = self._stats["chars"]']),
+       init, on_begin, at_end,
+       "k = cmap[ord(input[i])]" if self.byte_input else
+       "o = ord(input[i])\n                k = cmap[o] if o < %d else self.char_class(o)" % CMAP_SIZE,
+       self.counting(["prev  = state"], 16),
+       self.counting(["chars[prev] = chars.get(prev, 0) + 1"], 16),
+       on_scan, self.counting([self.count("retracts", "start", "i - last_i")],
+                              16),
+       on_token, self.counting([self.count("fails", "start"),
+                                self.count("retracts", "start", "i - begin")],
+                               12))
+
+    def match_fn_start(self, state, has_conditions=True, definition=None):
+        return ""
+
+    def match_fn_condition(self, intervals, nextstate):
+        return ""
+
+    def match_fn_end(self, accepting, definition, has_conditions=True):
+        return ""
+
+    @staticmethod
+    def array_literal(name, typecode, values, per_line=16):
+        lines = []
+        for i in range(0, len(values), per_line):
+            lines.append("        %s," % ", ".join([str(v) for v in values[i:i+per_line]]))
+        return """
+    %s = array('%s', [
+%s
+    ])
+""" % (name, typecode, "\n".join(lines))
+
+    @staticmethod
+    def typecode(values):
+        lo = min(values) if values else 0
+        hi = max(values) if values else 0
+        return 'h' if -0x8000 <= lo and hi < 0x8000 else 'i'
+
+    def transitions_fn(self, transitions, laststate):
+        t = Tables(transitions, laststate)
+
+        code = """
+    _nclasses    = %d
+    _bounds      = %s
+    _range_class = %s
+    _definitions = (%s)
+""" % (t.nclasses, t.bounds, t.range_class,
+       "".join(["%s, " % d for d in t.definitions]))
+
+        for name, values in [("_cmap", t.cmap),
+                             ("_trans", t.trans),
+                             ("_accept", t.accept),
+                             ("_next_start", t.next_start)]:
+            code += self.array_literal(name, self.typecode(values), values)
+
+        code += """
+    def install_transitions(self):
+        pass
+"""
+        return code
@@ -21,111 +21,91 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import bisect
+from contextlib import contextmanager
+
 EPS   = ''
 
 MATCH = 256 # Accepting state
 SPLIT = 257 # Split state
-ANY   = 258 # Matches any char
-
-class Ptr(object):
-    """
-    Simulates C pointer.
-    """
-    counter = 0
-
-    def __init__(self, value=None):
-        self._value = value
-
-        Ptr.counter += 1
-        self._id = Ptr.counter
-
-    def set_value(self, value):
-        self._value = value
-
-    def get_value(self):
-        return self._value
-
-    def id(self):
-        return self._id
-
-    def __repr__(self):
-        return "Ptr%d(%s)" % (self._id, self._value if self._value is not None else "-")
 
-class State(object):
-    counter = 0
+MAX_CHAR = 0x10FFFF # Largest code point
+BYTE_MAX = 0xFF     # Largest char of the byte alphabet
 
-    def __init__(self, c, out=None, out1=None):
-        State.counter += 1
-        self.id   = State.counter
-        self.c    = c
-        self.out  = Ptr(out)  if out  is None or type(out)  != type(Ptr) else out
-        self.out1 = Ptr(out1) if out1 is None or type(out1) != type(Ptr) else out1
-        self.lastlist = 0
-
-    def __repr__(self):
-        def get_char(p):
-            s = p.get_value()
-            return s.c if s is not None else ""
+@contextmanager
+def _no_stage(name):
+    # Stage timer of unprofiled builds.
+    yield {}
 
-        return "State%d(%s,Ptr%d(%s),Ptr%d(%s))" % \
-            (self.id, self.c, self.out.id(), get_char(self.out), self.out1.id(),
-             get_char(self.out1))
+# States a lazy DFA keeps before flushing its cache.
+LAZY_STATES = 4096
+# Chars scanned per cached state, since the last flush, below which a full
+# cache is thrashing: the rest of the scan simulates the NFA instead.
+LAZY_MIN_CHARS = 10
 
-MATCH_STATE = State(MATCH) # Accepting state
+# Escapes for control chars; any other escaped char stands for itself.
+ESCAPES = { 't' : '\t', 'n' : '\n', 'r' : '\r', 'f' : '\f', 'v' : '\v',
+            '0' : '\0' }
 
-class PtrList(object):
+class Context(object):
     """
-    List of state pointers.
+    NFA states of one compilation, as flat arrays indexed by state: state s
+    takes charset c[s] to out[s], or is a SPLIT state going to out[s] and
+    out1[s], or a MATCH state. Each Regex owns one: compilations share no
+    mutable state, and the states of every Regex are numbered from 1 in
+    creation order.
     """
-    counter = 0
-
-    def __init__(self, s=None):
-        self.data = [s]
-
-        PtrList.counter += 1
-        self._id = PtrList.counter
-
-    def patch(self, s):
-        for si in self.data:
-            si.set_value(s)
-
-    def append(self, l2):
-        for s in l2.data:
-            self.data.append(s)
-        return self
-
-    def __repr__(self):
-        return "Ptr[]%d(%s)" % (self._id, ",".join([str(s.get_value().c) for s in self.data]))
-
-class Frag(object):
-    def __init__(self, start, out):
-        assert start is not None
-        assert out is not None
-        self.start = start
-        self.out   = out
-
-    def __repr__(self):
-        return "Frag(%s, %s)" % (self.start, self.out)
+    def __init__(self):
+        # State 0 is not used.
+        self.c    = [None]
+        self.out  = [None]
+        self.out1 = [None]
+
+    def state(self, c, out=None, out1=None):
+        self.c.append(c)
+        self.out.append(out)
+        self.out1.append(out1)
+        return len(self.c) - 1
+
+    def patch(self, holes, s):
+        """
+        Point the dangling arrows holes (2*state for out, 2*state+1 for
+        out1) to s.
+        """
+        out, out1 = self.out, self.out1
+        for h in holes:
+            if h & 1:
+                out1[h >> 1] = s
+            else:
+                out[h >> 1] = s
 
-def _post2nfa(postfix):
+def _post2nfa(ctx, postfix, match):
     """
-    Convert postfix to NFA.
+    Convert postfix to NFA in ctx, returning its start state. Fragments are
+    (start state, dangling arrows); the dangling arrows of the last one are
+    patched to the match state.
     """
     stack = []
-        
+
     for i in range(postfix.size()):
 
         if postfix.is_concat(i):
             e2 = stack.pop()
             e1 = stack.pop()
-            e1.out.patch(e2.start)
-            stack.append(Frag(e1.start, e2.out))
+            ctx.patch(e1[1], e2[0])
+            stack.append((e1[0], e2[1]))
 
         elif postfix.is_alt(i):
             e2 = stack.pop()
             e1 = stack.pop()
-            s  = State(SPLIT, e1.start, e2.start)
-            stack.append(Frag(s, e1.out.append(e2.out)))
+            s  = ctx.state(SPLIT, e1[0], e2[0])
+            # The shorter list into the longer: a chain of alternatives
+            # stays linear whichever side it grows on.
+            holes, other = e1[1], e2[1]
+            if len(holes) < len(other):
+                holes, other = other, holes
+            holes.extend(other)
+            stack.append((s, holes))
 
         else:
             p = postfix.get(i)
@@ -133,35 +113,43 @@ def _post2nfa(postfix):
 
             if special and p == '?':
                 e = stack.pop()
-                s = State(SPLIT, e.start)
-                stack.append(Frag(s, e.out.append(PtrList(s.out1))))
+                s = ctx.state(SPLIT, e[0])
+                e[1].append(2*s + 1)
+                stack.append((s, e[1]))
 
             elif special and p == '*':
                 e = stack.pop()
-                s = State(SPLIT, e.start)
-                e.out.patch(s)
-                stack.append(Frag(s, PtrList(s.out1)))
+                s = ctx.state(SPLIT, e[0])
+                ctx.patch(e[1], s)
+                stack.append((s, [2*s + 1]))
 
             elif special and p == '+':
                 e = stack.pop()
-                s = State(SPLIT, e.start)
-                e.out.patch(s)
-                stack.append(Frag(e.start, PtrList(s.out1)))
+                s = ctx.state(SPLIT, e[0])
+                ctx.patch(e[1], s)
+                stack.append((e[0], [2*s + 1]))
 
             else:
-                if postfix.is_any(i):
-                    s = State(ANY)
-                else:
-                    s = State(p)
-                stack.append(Frag(s, PtrList(s.out)))
+                s = ctx.state(p)
+                stack.append((s, [2*s]))
 
     e = stack.pop()
     if stack:
         raise "Invalid regex postfix"
-        
-    e.out.patch(MATCH_STATE)
 
-    return e.start
+    ctx.patch(e[1], match)
+
+    return e[0]
+
+
+def _join(ctx, starts):
+    """
+    Join several NFAs under one start state using a chain of split states.
+    """
+    s = starts[-1]
+    for si in reversed(starts[:-1]):
+        s = ctx.state(SPLIT, si, s)
+    return s
 
 
 def e_closure(T, table):
@@ -194,49 +182,341 @@ def move(table, T, a):
     return tuple(sorted(s))
 
 
+def _closure(table, s):
+    # Epsilon closure of the NFA state s, as a frozenset.
+    members = set([s])
+    stack   = [s]
+    while stack:
+        for u in enlist(table[stack.pop()].get(EPS, [])):
+            if u not in members:
+                members.add(u)
+                stack.append(u)
+    return frozenset(members)
+
+def _closures(table, s0):
+    """
+    Epsilon closure of s0 and of the target of every consuming transition,
+    the only states sets of NFA states start from. Closures of the states
+    in between (e.g. the SPLIT chain of a wide alternation) are not kept:
+    each would hold most of the chain.
+    """
+    closures = { s0 : _closure(table, s0) }
+    for row in table.values():
+        for a, ts in row.items():
+            if a != EPS:
+                for t in enlist(ts):
+                    if t not in closures:
+                        closures[t] = _closure(table, t)
+    return closures
+
+def _bitset(index, T):
+    # Bitset of the states T, by index (T are indices if index is None).
+    bits = bytearray("0" * (max([index[t] if index else t for t in T]) + 1
+                            if T else 1))
+    for t in T:
+        bits[-1 - (index[t] if index else t)] = "1"
+    return int(str(bits), 2)
+
+class _Successors(dict):
+    """
+    Bitset closure of the target of each consuming NFA state, by index,
+    computed on first lookup: a scan pays only for the states it reaches.
+    """
+    def __init__(self, table, states, index):
+        dict.__init__(self)
+        self._table  = table
+        self._states = states
+        self._index  = index
+
+    def __missing__(self, i):
+        for k, t in self._table[self._states[i]].items():
+            if k != EPS:
+                mask = self[i] = _bitset(self._index,
+                                         _closure(self._table, t))
+                return mask
+
+def _members(mask):
+    # Indices of the bits set in mask.
+    bits = bin(mask)[:1:-1]
+    out  = []
+    i    = bits.find('1')
+    while i >= 0:
+        out.append(i)
+        i = bits.find('1', i+1)
+    return out
+
 def nfa_to_dfa(table, s0, syms):
-    def put(d_states, inv_d_dtates, U, mark=0):
-        old = inv_d_states[1-mark]
-        if U in old:
-            old.remove(U)
+    """
+    Subset construction. Returns the start state and the transitions
+    {T: {a: U}} of the DFA, whose states are sorted tuples of NFA states.
 
-        d_states[U] = mark
-        inv_d_states[mark].add(U)
+    The epsilon closure of each state a set starts from is computed once,
+    and only the transitions of the states in a set are looked at. Sets are frozensets,
+    not bitsets: on large patterns they are sparse, and every operation on a
+    bitset costs as much as the whole NFA.
+    """
+    closures = _closures(table, s0)
+
+    # (symbol, closure of the target) of the transitions of each NFA state.
+    moves = dict([(s, [(a, closures[t]) for a, ts in table[s].items()
+                       if a != EPS and a in syms for t in enlist(ts)])
+                  for s in table])
+
+    keys = {}
+    def key(U):
+        if U not in keys:
+            keys[U] = tuple(sorted(U))
+        return keys[U]
+
+    d_tran = {}
+
+    start = closures[s0]
+    key(start)
+    todo = [start]
+
+    while todo:
+        T = todo.pop()
+
+        # Unions built in place: one frozenset per target, not per member.
+        targets = {}
+        for s in T:
+            for a, c in moves[s]:
+                if a in targets:
+                    targets[a].update(c)
+                else:
+                    targets[a] = set(c)
+        if not targets:
+            continue
 
-        return U
+        row = d_tran.setdefault(keys[T], {})
+        for a, U in targets.items():
+            U = frozenset(U)
+            if U not in keys:
+                todo.append(U)
+            row[a] = key(U)
+            d_tran.setdefault(row[a], {})
 
-    def has_unmarked(d_states, inv_d_states):
-        return len(inv_d_states[0]) > 0
+    return keys[start], d_tran
 
-    def extract_unmarked(d_states, inv_d_states):
-        s = inv_d_states[0]
-        return put(d_states, inv_d_states, s.pop(), 1)
+def minimize_dfa(start, table, label):
+    """
+    Minimize a DFA using Hopcroft's partition refinement.
 
-    d_states     = {}
-    inv_d_states = { 0 : set([]), 1 : set([]) }
-    d_tran       = {}
+    label(state) gives the accepting label of a state (None if not
+    accepting); only states with the same label can be merged. Missing
+    transitions go to an implicit dead state. Each block of equivalent states
+    is represented by its smallest member, so the result has the same shape
+    as the input table.
+    """
+    DEAD = ()
 
-    start = e_closure([s0], table)
-    put(d_states, inv_d_states, start)
+    states = sorted(table) + [DEAD]
+    syms   = sorted(set([a for row in table.values() for a in row]))
 
-    while has_unmarked(d_states, inv_d_states):
-        T = extract_unmarked(d_states, inv_d_states)
-        if not T:
+    # Inverse transitions: {t: {a: states going to t on a}}.
+    inv = {}
+    for s in states:
+        row = table.get(s, {})
+        for a in syms:
+            inv.setdefault(row.get(a, DEAD), {}).setdefault(a, []).append(s)
+
+    # Initial partition by accepting label.
+    groups = {}
+    for s in states:
+        groups.setdefault(label(s) if s != DEAD else None, set([])).add(s)
+
+    partition = [groups[k] for k in sorted(groups)]
+    block_of  = {}
+    for i, block in enumerate(partition):
+        for s in block:
+            block_of[s] = i
+
+    work = set(range(len(partition)))
+
+    while work:
+        # Only the symbols the splitter has transitions on.
+        preds = {}
+        for t in partition[work.pop()]:
+            for a, ss in inv.get(t, {}).items():
+                preds.setdefault(a, set([])).update(ss)
+
+        for a in sorted(preds):
+            X = preds[a]
+
+            touched = {}
+            for s in X:
+                touched.setdefault(block_of[s], set([])).add(s)
+
+            for i in sorted(touched):
+                Y  = partition[i]
+                Y1 = touched[i]
+                if len(Y1) == len(Y):
+                    continue
+
+                # Move the smaller half out of Y into a new block, in time
+                # proportional to it (or to Y1, already paid for).
+                if 2 * len(Y1) <= len(Y):
+                    small = Y1
+                else:
+                    small = Y - Y1
+                Y.difference_update(small)
+                j = len(partition)
+                partition.append(small)
+                for s in small:
+                    block_of[s] = j
+
+                # The smaller half is enough, unless Y was still to be
+                # processed: then both are.
+                work.add(j)
+
+    rep = {}
+    for block in partition:
+        r = min(block)
+        for s in block:
+            rep[s] = r
+
+    dead = rep[DEAD]
+
+    min_table = {}
+    for s in table:
+        r = rep[s]
+        if r == dead or r in min_table:
             continue
+        row = {}
+        for a, t in table[s].items():
+            if rep[t] != dead:
+                row[a] = rep[t]
+        min_table[r] = row
 
-        for a in syms:
-            U = e_closure(move(table, T, a), table)
-            if U:
-                if U not in d_states:
-                    put(d_states, inv_d_states, U)
+    return rep[start], min_table
 
-                d_tran.setdefault(T, {})
-                d_tran.setdefault(U, {})
-                d_tran[T][a] = U
+def charset(intervals):
+    """
+    Normalize (lo, hi) code point intervals into a sorted tuple of disjoint,
+    non-adjacent intervals.
+    """
+    out = []
+    for lo, hi in sorted(intervals):
+        if out and lo <= out[-1][1] + 1:
+            if hi > out[-1][1]:
+                out[-1] = (out[-1][0], hi)
+        else:
+            out.append((lo, hi))
+    return tuple(out)
+
+def negate(cs, max_char=MAX_CHAR):
+    """
+    Complement of a charset within [0, max_char].
+    """
+    out = []
+    lo  = 0
+    for a, b in cs:
+        if a > lo:
+            out.append((lo, a-1))
+        lo = b+1
+    if lo <= max_char:
+        out.append((lo, max_char))
+    return tuple(out)
+
+def charset_contains(cs, o):
+    for lo, hi in cs:
+        if o < lo:
+            return False
+        if o <= hi:
+            return True
+    return False
+
+def charset_repr(cs):
+    def char(o):
+        return repr(unichr(o))[2:-1]
+
+    if len(cs) == 1 and cs[0][0] == cs[0][1]:
+        return char(cs[0][0])
+    return "[%s]" % "".join([char(lo) if lo == hi else "%s-%s" % (char(lo), char(hi))
+                             for lo, hi in cs])
+
+def any_char(max_char=MAX_CHAR):
+    """
+    Charset of . (anything but a newline).
+    """
+    return negate(charset([(ord('\n'), ord('\n'))]), max_char)
+
+ANY = any_char()
+
+def alphabet(charsets):
+    """
+    Split the alphabet into equivalence classes: two chars are in the same
+    class iff each of the charsets contains either both or neither of them.
+
+    Returns (classes, bounds, range_class, members) where classes[k] is the
+    charset of class k, bounds/range_class map a code point to its class
+    (see char_class) and members[j] lists the classes of charsets[j].
+    """
+    points = set([])
+    for cs in charsets:
+        for lo, hi in cs:
+            points.add(lo)
+            points.add(hi+1)
+    bounds = sorted(points)
+
+    # Elementary range k is [bounds[k], bounds[k+1]-1].
+    signature = [[] for _ in bounds]
+    for j, cs in enumerate(charsets):
+        for lo, hi in cs:
+            for k in range(bisect.bisect_left(bounds, lo),
+                           bisect.bisect_left(bounds, hi+1)):
+                signature[k].append(j)
+
+    classes     = []
+    range_class = []
+    class_of    = {}
+    for k, sig in enumerate(signature):
+        if not sig:
+            range_class.append(None)
+            continue
+        sig = tuple(sig)
+        if sig not in class_of:
+            class_of[sig] = len(classes)
+            classes.append([])
+        classes[class_of[sig]].append((bounds[k], bounds[k+1]-1))
+        range_class.append(class_of[sig])
+
+    members = [set([]) for _ in charsets]
+    for sig, k in class_of.items():
+        for j in sig:
+            members[j].add(k)
+
+    return ([tuple(c) for c in classes], bounds, range_class,
+            [sorted(m) for m in members])
+
+def char_class(bounds, range_class, c):
+    """
+    Class of char c, None if no charset contains it.
+    """
+    k = bisect.bisect_right(bounds, ord(c)) - 1
+    if k < 0:
+        return None
+    return range_class[k]
 
-    return start, d_tran
+def _escaped(regex, i):
+    """
+    Char at regex[i], resolving a backslash escape. Returns (char, next i).
+    """
+    c = regex[i]
+    if c != '\\':
+        return c, i+1
+    assert i+1 < len(regex)
+    c = regex[i+1]
+    return ESCAPES.get(c, c), i+2
+
+def transform(regex, max_char=MAX_CHAR):
+    """
+    Split the pattern into atoms and operators. Each char, escape, class and
+    . becomes a charset (tuple of intervals); ( ) | * + ? are kept as chars.
 
-def transform(regex):
+    max_char bounds the alphabet: MAX_CHAR for unicode text, BYTE_MAX for
+    bytes.
+    """
     regex2 = []
 
     i = 0
@@ -245,46 +525,46 @@ def transform(regex):
     while i < n:
         c = regex[i]
 
-        if c == '\\':
-            assert i+1 < n
-            regex2.append('\\')
-            regex2.append(regex[i+1])
-            i += 2
-            continue
-        
-        if c != '[':
+        if c in "()|*+?":
             regex2.append(c)
             i += 1
             continue
 
-        regex2.append('(')
+        if c == '.':
+            regex2.append(any_char(max_char))
+            i += 1
+            continue
 
-        l2 = []
+        if c != '[':
+            c, i = _escaped(regex, i)
+            assert ord(c) <= max_char
+            regex2.append(charset([(ord(c), ord(c))]))
+            continue
 
         i += 1
 
-        while i < n and regex[i] != ']':
-            if i+2 < n and regex[i+1] == '-' and regex[i+1] != ']':
-                cs = regex[i]
-                ce = regex[i+2]
-                for cj in range(ord(cs), ord(ce)+1):
-                    l2.append(chr(cj))
-                i += 3
-            else:
-                if regex[i] == '\\':
-                    l2.append(regex[i:i+2])
-                    i += 2
-                else:
-                    l2.append('\\' + regex[i])
-                    i += 1
+        negated = i < n and regex[i] == '^'
+        if negated:
+            i += 1
 
-        assert regex[i] == ']'
-        regex2.append("|".join(l2))
-        regex2.append(')')
+        l2 = []
+
+        while i < n and regex[i] != ']':
+            cs, i = _escaped(regex, i)
+            ce    = cs
+            if i+1 < n and regex[i] == '-' and regex[i+1] != ']':
+                ce, i = _escaped(regex, i+1)
+            assert ord(cs) <= ord(ce) <= max_char
+            l2.append((ord(cs), ord(ce)))
+
+        assert i < n and regex[i] == ']'
+        assert l2
+        cs = charset(l2)
+        regex2.append(negate(cs, max_char) if negated else cs)
 
         i += 1
 
-    return "".join(regex2)
+    return regex2
 
 
 class Regex(object):
@@ -334,19 +614,12 @@ class Regex(object):
             self.ctype[len(self.postfix)] = ','
             self.postfix.append(',')
 
-        def any(self):
-            self.ctype[len(self.postfix)] = '.'
-            self.postfix.append('.')
-
         def is_alt(self, i):
             return self.ctype.get(i, '') == '|'
 
         def is_concat(self, i):
             return self.ctype.get(i, '') == ','
 
-        def is_any(self, i):
-            return self.ctype.get(i, '') == '.'
-
         def is_special(self, i):
             return self.ctype.get(i, '') != ''
 
@@ -361,28 +634,102 @@ class Regex(object):
                 yield c
             
         def __repr__(self):
-            return "".join(self.postfix)
+            return "".join([c if self.is_special(i) else charset_repr(c)
+                            for i, c in enumerate(self.postfix)])
+
+    def __init__(self, pattern, minimize=False, max_char=MAX_CHAR,
+                 stage=None, lazy=False):
+        # stage(name) times the stage name: a context manager yielding a dict
+        # that takes the sizes of what the stage built.
+        self._stage   = stage or _no_stage
+        self._context = Context()
+        # Created first, the match state has the smallest id.
+        self._matches = [self._context.state(MATCH)]
+
+        with self._stage("transform") as sizes:
+            self._pattern = transform(pattern, max_char)
+            sizes["atoms"] = len(self._pattern)
+        with self._stage("re2post") as sizes:
+            self._postfix = Regex._re2post(self._pattern)
+            sizes["postfix"] = self._postfix.size()
+        with self._stage("post2nfa"):
+            self._nfa     = _post2nfa(self._context, self._postfix,
+                                      self._matches[0])
+
+        self._build(minimize, lazy)
+
+    def _build(self, minimize, lazy=False):
+        # Bitset NFA, built on the first nfa_match or nfa_search.
+        self._sim = None
+
+        with self._stage("nfa_table") as sizes:
+            self._nfa_table, self._syms = self._construct_nfa_table()
+            sizes["nfa_states"] = len(self._nfa_table)
+            sizes["classes"]    = len(self._classes)
+
+        # A lazy Regex has no DFA tables: its states are built while
+        # matching.
+        self._lazy = None
+        if lazy:
+            self._lazy = LazyDFA(self)
+            self._dfa_start = self._dfa_table = None
+            self._stats = { "nfa_states" : len(self._nfa_table),
+                            "classes"    : len(self._classes) }
+            return
 
-    def __init__(self, pattern):
-        self._pattern = transform(pattern)
-        self._postfix = Regex._re2post(self._pattern)
-        self._nfa     = _post2nfa(self._postfix)
+        with self._stage("nfa_to_dfa") as sizes:
+            self._dfa_start, self._dfa_table = nfa_to_dfa(self.nfa_table(),
+                                                          self.nfa_start(),
+                                                          self.syms())
+            sizes["dfa_states"] = len(self._dfa_table)
 
-        self._nfa_table, self._syms = self._construct_nfa_table()
+        self._stats = { "nfa_states" : len(self._nfa_table),
+                        "dfa_states" : len(self._dfa_table),
+                        "classes"    : len(self._classes) }
 
-        self._dfa_start, self._dfa_table = nfa_to_dfa(self.nfa_table(),
-                                                      self.nfa_start(),
-                                                      self.syms())
+        if minimize:
+            self.minimize()
 
+    def minimize(self):
+        """
+        Replace the DFA with its minimal equivalent.
+        """
+        assert self._lazy is None, "A lazy DFA is not minimized"
+        with self._stage("minimize") as sizes:
+            self._dfa_start, self._dfa_table = minimize_dfa(self._dfa_start,
+                                                            self._dfa_table,
+                                                            self.accepts)
+            sizes["min_dfa_states"] = len(self._dfa_table)
+        self._stats["min_dfa_states"] = len(self._dfa_table)
+
+    def stats(self):
+        """
+        Sizes: nfa_states, dfa_states, classes and, once minimized,
+        min_dfa_states. Lazy DFAs report the counters of LazyDFA instead of
+        the DFA sizes.
+        """
+        if self._lazy is not None:
+            return dict(self._stats.items() + self._lazy.stats.items())
+        return self._stats
 
     def nfa_start(self):
-        return self._nfa.id
+        return self._nfa
 
     def dfa_start(self):
         return self._dfa_start
 
     def accepting(self):
-        return MATCH_STATE.id
+        return self._matches[0]
+
+    def accepts(self, state):
+        """
+        Index of the pattern accepted by the DFA state, None if the state is
+        not accepting. Lower index wins when a state accepts several patterns.
+        """
+        for i, m in enumerate(self._matches):
+            if m in state:
+                return i
+        return None
 
     def nfa_table(self):
         return self._nfa_table
@@ -393,6 +740,18 @@ class Regex(object):
     def syms(self):
         return self._syms
 
+    def classes(self):
+        """
+        Charset of each symbol (alphabet equivalence class) in syms().
+        """
+        return self._classes
+
+    def char_class(self, c):
+        """
+        Symbol of char c, None if no transition of the pattern takes c.
+        """
+        return char_class(self._bounds, self._range_class, c)
+
     @staticmethod
     def _re2post(pattern):
         # Stack to maintain state per sub expression (enclosed in parenthesis).
@@ -401,7 +760,7 @@ class Regex(object):
         curr   = Regex.Node()
         output = Regex.Postfix()
 
-        # Go over input one char at a time.
+        # Go over transformed input one atom or operator at a time.
         index = -1
         N     = len(pattern)
         while index < N-1:
@@ -447,22 +806,12 @@ class Regex(object):
                 output.special(c)
 
             else:
-                any = c == '.'
-
-                if c == '\\':
-                    index += 1
-                    assert index < N
-                    c = pattern[index]
-                
                 # Append previous pending concatenation.
                 if curr.natom > 1:
                     curr.decr_natom()
                     output.concat()
-                # Add char c to output.
-                if any:
-                    output.any()
-                else:
-                    output.add(c)
+                # Add charset c to output.
+                output.add(c)
                 # Need to concatenate.
                 curr.incr_natom()
       
@@ -477,83 +826,127 @@ class Regex(object):
 
         return output
 
-    listid = 0
+    def _simulation(self):
+        """
+        The NFA as bitsets over its states in sorted order, for nfa_match,
+        nfa_search and LazyDFA: the closure of the start state, the states
+        with a transition on each symbol, the closure of the target of each
+        such state (computed when first looked up) and the match states.
+        """
+        if self._sim is None:
+            table  = self.nfa_table()
+            states = sorted(table)
+            index  = dict([(s, i) for i, s in enumerate(states)])
+
+            on = [[] for _ in self._classes]
+            for s in states:
+                for k in table[s]:
+                    if k != EPS:
+                        on[k].append(index[s])
+
+            self._sim = (_bitset(index, _closure(table, self.nfa_start())),
+                         [_bitset(None, i) for i in on],
+                         _Successors(table, states, index),
+                         _bitset(index, self._matches))
+        return self._sim
+
+    @staticmethod
+    def _nfa_step(states, k, on, succ):
+        # States reached from states on the char of symbol k.
+        if k is None:
+            return 0
+        next = 0
+        for i in _members(states & on[k]):
+            next |= succ[i]
+        return next
 
     def nfa_match(self, input):
         """
         Check whether regex matches the input using NFA.
         """
-        Regex.listid += 1
-        clist = self._start_list(self._nfa)
+        start, on, succ, matches = self._simulation()
 
-        for s in input:
-            clist = self._step(clist, s)
-    
-        return self._is_match(clist)
-
-    def _is_match(self, l):
-        for s in l:
-            if s == MATCH_STATE:
-                return True
-        return False
-
-    def _add_state(self, l, s):
-        if s is None or s.lastlist == Regex.listid:
-            return
-
-        s.lastlist = Regex.listid
-        if s.c == SPLIT:
-            self._add_state(l, s.out.get_value())
-            self._add_state(l, s.out1.get_value())
-            return
-        l.append(s)
-
-    def _start_list(self, s):
-        Regex.listid += 1
-        l = []
-        self._add_state(l, s)
-        return l
-
-    def _step(self, clist, c):
-        Regex.listid += 1
-        nlist = []
-        for s in clist:
-            if s.c == c or s.c == ANY:
-                self._add_state(nlist, s.out.get_value())
-        return nlist
-
-    @staticmethod
-    def _recursive_construct_nfa_table(table, s, states):
-        if s is None or s.id in states or s.c == MATCH:
-            return
+        states = start
+        for c in input:
+            states = self._nfa_step(states, self.char_class(c), on, succ)
+            if not states:
+                return False
 
-        states.add(s.id)
-        m = table.setdefault(s.id, {})
+        return bool(states & matches)
 
-        if s.c == SPLIT:
-            m[EPS] = [s.out.get_value().id, s.out1.get_value().id]
-            Regex._recursive_construct_nfa_table(table, s.out.get_value(), states)
-            Regex._recursive_construct_nfa_table(table, s.out1.get_value(), states)
-            return
-
-        m[s.c] = s.out.get_value().id
-        Regex._recursive_construct_nfa_table(table, s.out.get_value(), states)
+    def nfa_search(self, input, pos=0):
+        """
+        (start, end) of the leftmost longest match in input from pos on,
+        None if there is none.
+        """
+        start, on, succ, matches = self._simulation()
+
+        best = None
+        # [start position, states] of the running matches by start position;
+        # a state is followed only for the leftmost start reaching it.
+        threads = []
+        i = pos
+        while True:
+            if best is None:
+                threads.append([i, start])
+
+            seen  = 0
+            alive = []
+            for thread in threads:
+                thread[1] &= ~seen
+                if not thread[1]:
+                    continue
+                seen |= thread[1]
+                alive.append(thread)
+                if thread[1] & matches:
+                    if best is None or thread[0] <= best[0]:
+                        best = (thread[0], i)
+                    # Later starts cannot win any more.
+                    break
+            threads = alive
+
+            if i >= len(input) or not threads:
+                return best
+
+            k = self.char_class(input[i])
+            for thread in threads:
+                thread[1] = self._nfa_step(thread[1], k, on, succ)
+            i += 1
 
     def _construct_nfa_table(self):
-        states = set([])
-        table  = {}
+        ctx   = self._context
+        table = {}
+
+        for m in self._matches:
+            table[m] = {}
+
+        # States reachable from the start.
+        stack = [self._nfa]
+        while stack:
+            s = stack.pop()
+            if s is None or s in table:
+                continue
+            if ctx.c[s] == SPLIT:
+                table[s] = { EPS : [ctx.out[s], ctx.out1[s]] }
+                stack.append(ctx.out1[s])
+            else:
+                table[s] = { ctx.c[s] : ctx.out[s] }
+            stack.append(ctx.out[s])
 
-        table[MATCH_STATE.id] = {}
-        
-        Regex._recursive_construct_nfa_table(table, self._nfa, states)
+        # Replace charsets by the equivalence classes they cover.
+        charsets = sorted(set([c for row in table.values() for c in row
+                               if c != EPS]))
+        self._classes, self._bounds, self._range_class, members = \
+            alphabet(charsets)
 
-        syms = set([])
-        for _, row in table.items():
-            for c in row:
-                if c != EPS:
-                    syms.add(c)
+        class_map = dict(zip(charsets, members))
+        for s, row in table.items():
+            if not row or EPS in row:
+                continue
+            (cs, t), = row.items()
+            table[s] = dict([(k, t) for k in class_map[cs]])
 
-        return table, syms
+        return table, set(range(len(self._classes)))
 
     def print_nfa_table(self):
         t = self.nfa_table()
@@ -567,23 +960,232 @@ class Regex(object):
         for s in sorted(t):
             print s, t[s]
 
+    def print_classes(self):
+        print "Classes:"
+        for k, cs in enumerate(self.classes()):
+            print k, charset_repr(cs)
+
     def dfa_match(self, input):
+        if self._lazy is not None:
+            return self._lazy.match(input)
+
         state = self.dfa_start()
         table = self.dfa_table()
 
         for i in input:
             row = table[state]
-            if i in row:
-                state = row[i]
-            elif ANY in row:
-                state = row[ANY]
+            k   = self.char_class(i)
+            if k in row:
+                state = row[k]
             else:
                 return False
 
-        return self.accepting() in state
+        return self.accepts(state) is not None
+
+    def longest_match(self, input, pos=0):
+        """
+        End of the longest match in input starting at pos, None if there is
+        none.
+        """
+        if self._lazy is not None:
+            return self._lazy.longest(input, pos)
+
+        state = self.dfa_start()
+        table = self.dfa_table()
+        last  = pos if self.accepts(state) is not None else None
+
+        for i in xrange(pos, len(input)):
+            k = self.char_class(input[i])
+            state = table.get(state, {}).get(k)
+            if state is None:
+                break
+            if self.accepts(state) is not None:
+                last = i + 1
+
+        return last
+
+    def longest_accept(self, input, pos=0):
+        """
+        (end, pattern) of the longest match in input starting at pos, pattern
+        being accepts() of the state at end; None if there is no match.
+        """
+        if self._lazy is not None:
+            return self._lazy.longest_accept(input, pos)
+
+        state = self.dfa_start()
+        table = self.dfa_table()
+        last  = None
+        if self.accepts(state) is not None:
+            last = (pos, self.accepts(state))
+
+        for i in xrange(pos, len(input)):
+            k = self.char_class(input[i])
+            state = table.get(state, {}).get(k)
+            if state is None:
+                break
+            if self.accepts(state) is not None:
+                last = (i + 1, self.accepts(state))
+
+        return last
+
+
+class LazyDFA(object):
+    """
+    DFA of a Regex built while matching, one state (a set of NFA states) and
+    one transition at a time, as RE2 does: only the states the input leads
+    to are ever built. At most max_states are cached; a full cache is
+    flushed, and when it fills up again too fast the rest of the scan
+    simulates the NFA.
+
+    States are frozensets, and the closures they are made of are computed
+    when a state is first built: like the states, they cost memory only for
+    what the input reaches.
+    """
+    def __init__(self, rx, max_states=LAZY_STATES):
+        self.rx         = rx
+        self.max_states = max_states
+        # states -> {symbol: (next states, accept() of them)}
+        self._cache     = {}
+        # NFA state -> epsilon closure, flushed with the cache.
+        self._closures  = {}
+        self._matches   = frozenset(rx._matches)
+        self._pattern   = dict([(m, i) for i, m in enumerate(rx._matches)])
+        start           = _closure(rx.nfa_table(), rx.nfa_start())
+        self._start     = (start, self._accept(start))
+        self.stats      = { "lazy_states"   : 0,
+                            "lazy_flushes"  : 0,
+                            "nfa_fallbacks" : 0 }
+
+    def _run(self, input, pos):
+        """
+        Run from pos until the input ends or no state is left. Returns
+        (states, end of the scan, end of the longest match or None, pattern
+        matched up to that end).
+        """
+        step       = self._step
+        char_class = self.rx.char_class
+        cache      = self._cache
+
+        states, pattern = self._start
+        last     = pos if pattern is not None else None
+        flushed  = pos
+        nfa     = False
+
+        i = pos
+        n = len(input)
+        while i < n and states:
+            k = char_class(input[i])
+
+            row = None if nfa else cache.get(states)
+            if row is None and not nfa:
+                if len(cache) >= self.max_states:
+                    cache.clear()
+                    self._closures.clear()
+                    self.stats["lazy_flushes"] += 1
+                    if i - flushed < LAZY_MIN_CHARS * self.max_states:
+                        self.stats["nfa_fallbacks"] += 1
+                        nfa = True
+                    flushed = i
+                if not nfa:
+                    row = cache[states] = {}
+                    self.stats["lazy_states"] += 1
+
+            if row is None:
+                states = step(states, k)
+                accept = self._accept(states)
+            else:
+                next = row.get(k)
+                if next is None:
+                    next = step(states, k)
+                    next = row[k] = (next, self._accept(next))
+                states, accept = next
+
+            i += 1
+            if accept is not None:
+                last    = i
+                pattern = accept
+
+        return states, i, last, pattern
+
+    def _closure(self, s):
+        closures = self._closures
+        if s not in closures:
+            closures[s] = _closure(self.rx.nfa_table(), s)
+        return closures[s]
+
+    def _accept(self, states):
+        # Regex.accepts() of the lazy state states.
+        matched = self._matches & states
+        if not matched:
+            return None
+        return min([self._pattern[m] for m in matched])
+
+    def _step(self, states, k):
+        # States reached from states on the char of symbol k.
+        if k is None:
+            return frozenset()
+        table = self.rx.nfa_table()
+        next  = set([])
+        for s in states:
+            ts = table[s].get(k)
+            if ts is not None:
+                for t in enlist(ts):
+                    next.update(self._closure(t))
+        return frozenset(next)
+
+    def match(self, input):
+        states, end, last, _ = self._run(input, 0)
+        return end == len(input) and last == end
+
+    def longest(self, input, pos=0):
+        """
+        End of the longest match in input starting at pos, None if there is
+        none.
+        """
+        return self._run(input, pos)[2]
+
+    def longest_accept(self, input, pos=0):
+        """
+        (end, pattern) of the longest match in input starting at pos, pattern
+        being the index of the first pattern matching up to end as in
+        Regex.accepts(); None if there is no match.
+        """
+        _, _, last, pattern = self._run(input, pos)
+        if last is None:
+            return None
+        return last, pattern
+
+
+class RegexSet(Regex):
+    """
+    Several patterns determinized into one DFA.
+
+    Every pattern gets its own match state and the NFAs are joined under one
+    start state. accepts() reports the first pattern (by position in the list)
+    matched by a DFA state.
+    """
+    def __init__(self, patterns, minimize=False, max_char=MAX_CHAR,
+                 stage=None, lazy=False):
+        assert patterns
+        self._stage   = stage or _no_stage
+        self._context = Context()
+
+        with self._stage("transform") as sizes:
+            self._pattern = [transform(p, max_char) for p in patterns]
+            sizes["atoms"] = sum(map(len, self._pattern))
+        with self._stage("re2post") as sizes:
+            self._postfix = [Regex._re2post(p) for p in self._pattern]
+            sizes["postfix"] = sum([p.size() for p in self._postfix])
+        self._matches = [self._context.state(MATCH) for _ in patterns]
+
+        with self._stage("post2nfa"):
+            self._nfa = _join(self._context,
+                              [_post2nfa(self._context, p, m)
+                               for p, m in zip(self._postfix, self._matches)])
+
+        self._build(minimize, lazy)
 
 
-from contextlib import contextmanager
 import datetime
 
 @contextmanager
@@ -599,20 +1201,28 @@ if __name__ == '__main__':
     import sys
     import re
 
-    print transform(sys.argv[1])
+    print Regex._re2post(transform(sys.argv[1]))
 
     r1 = Regex(sys.argv[1])
     r2 = re.compile(sys.argv[1])
 
+    r1.print_classes()
     r1.print_nfa_table()
     r1.print_dfa_table()
 
+    r1.minimize()
+    r1.print_dfa_table()
+    print r1.stats()
+
     for input in sys.argv[2:]:
         print input, r1.dfa_match(input)
 
     for input in sys.argv[2:]:
         print input, r1.nfa_match(input)
 
+    for input in sys.argv[2:]:
+        print input, r1.nfa_search(input)
+
     if len(sys.argv) <= 2:
         exit()
 
@@ -621,9 +1231,15 @@ if __name__ == '__main__':
     with timeit("dfa_match"):
         r1.dfa_match(input)
 
+    with timeit("lazy dfa_match"):
+        Regex(sys.argv[1], lazy=True).dfa_match(input)
+
     with timeit("nfa_match"):
         r1.nfa_match(input)
 
+    with timeit("nfa_search"):
+        r1.nfa_search(input)
+
     with timeit("re"):
         r2.match(input)
 
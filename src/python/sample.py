@@ -5,6 +5,8 @@ Lexical analyzer.
 Generated from 'sample.lang' by LANG.
 """
 
+from array import array
+
 
 # -------------------
 # Constants start
@@ -43,8 +45,19 @@ class LangException(Exception):
         return self.msg + ":\n" + self.line
 
 class PyLexer(object):
-    def __init__(self, input):
-        self.input        = input
+    def __init__(self, input, bufsize=65536):
+        # input is a string, a file object or an iterator of chunks. For the
+        # last two, self.input is a sliding buffer holding the current token
+        # and what has been read past it; offset is the position of its first
+        # char in the whole input.
+        if isinstance(input, basestring):
+            self.input   = input
+            self._chunks = None
+        else:
+            self.input   = input.read(0) if hasattr(input, "read") else ""
+            self._chunks = self._read_chunks(input, bufsize)
+        self._bufsize     = bufsize
+        self.offset       = 0
         self.input_index  = 0
         self.lexeme_begin = 0
         self.start_state  = 0
@@ -52,8 +65,16 @@ class PyLexer(object):
         self._yystart     = 0
         self._yyend       = 0
         self._yytoken     = None
+        # matched() slices the text of each token, unless tokenize_into()
+        # runs no rules.
+        self._yyslice     = True
         self._yyid        = None
         self._yynum       = None
+        # Longest match seen so far for the current token.
+        self._last_accept = None
+        self._last_index  = 0
+        # End of the text looked at for the current token.
+        self._yyscan      = 0
 
         self.table = []
         self.install_transitions()
@@ -63,11 +84,38 @@ class PyLexer(object):
 
         self.user_variables = {}
 
-    def put_table(self, state, fn, next_start=None):
-        if state >= len(self.table):
-            for i in range(len(self.table), state+8):
-                self.table.append(None)
-        self.table[state] = [fn, next_start]
+    @staticmethod
+    def _read_chunks(input, bufsize):
+        if not hasattr(input, "read"):
+            for chunk in input:
+                yield chunk
+            return
+        while True:
+            chunk = input.read(bufsize)
+            if not chunk:
+                return
+            yield chunk
+
+    def _refill(self):
+        # Append the next chunk to the buffer, dropping what was consumed
+        # before the current token (but for some context for error messages).
+        # Returns the number of chars dropped, None at the end of input.
+        if self._chunks is None:
+            return None
+        for chunk in self._chunks:
+            if chunk:
+                break
+        else:
+            self._chunks = None
+            return None
+
+        shift = max(self.lexeme_begin - 20, 0)
+        self.input         = self.input[shift:] + chunk
+        self.offset       += shift
+        self.input_index  -= shift
+        self.lexeme_begin -= shift
+        self._last_index  -= shift
+        return shift
 
     def raise_exception(self):
         start  = max(self.input_index - 20, 0)
@@ -75,9 +123,12 @@ class PyLexer(object):
         start  = max(start, data.rfind("\n"))
         length = min(self.input_index, len(self.input)) + 1 - start
         data   = data + "\n" + ("-" * (length-1)) + "^"
-        raise LangException(data, "Failed to parse input")
+        raise LangException(data, "Failed to parse input at offset %d" %
+                            (self.offset + self.input_index))
 
     def nextchar(self):
+        if self.input_index >= len(self.input):
+            self._refill()
         if self.input_index > len(self.input):
             self.raise_exception()
         i = self.input_index
@@ -87,13 +138,50 @@ class PyLexer(object):
         return None
 
     def eof(self):
-        return self.input_index >= len(self.input)
+        if self.input_index < len(self.input):
+            return False
+        return self._refill() is None
 
     def retract(self, n=1):
         self.input_index -= n
         if self.input_index < 0:
             self.input_index = 0
 
+    def yystart(self):
+        return self._yystart
+
+    def yyend(self):
+        return self._yyend
+
+    def yyspan(self):
+        return self._yystart, self._yyend
+
+    def yytoken(self):
+        return self._yytoken
+
+    def matched(self, definition):
+        self.curr_state  = 0
+        self.start_state = 0
+        self._last_accept = None
+        self._yyid        = definition
+
+        self._yystart = self.offset + self.lexeme_begin
+        self._yyend   = self.offset + self.input_index
+        self._yytoken = self.input[self.lexeme_begin:self.input_index] if self._yyslice else None
+
+        self.lexeme_begin = self.input_index
+
+        rule = self._rules.get(definition)
+        if rule:
+            return rule(self)
+        return
+
+    def put_table(self, state, fn, next_start=None):
+        if state >= len(self.table):
+            for i in range(len(self.table), state+8):
+                self.table.append(None)
+        self.table[state] = [fn, next_start]
+
     def get_transition(self, state):
         return self.table[state][0]
 
@@ -117,224 +205,165 @@ class PyLexer(object):
             if retval is not None:
                 return retval
 
-    def yystart(self):
-        return self._yystart
-
-    def yyend(self):
-        return self._yyend
-
-    def yytoken(self):
-        return self._yytoken
-
-    def matched(self, definition):
-        self.curr_state  = 0
-        self.start_state = 0
-
-        self._yystart = self.lexeme_begin
-        self._yyend   = self.input_index
-        self._yytoken = self.input[self._yystart:self._yyend]
+    def accept(self, definition):
+        self._last_accept = definition
+        self._last_index  = self.input_index
 
-        self.lexeme_begin = self.input_index
+    def dead(self):
+        if self.offset + self.input_index > self._yyscan:
+            self._yyscan = self.offset + self.input_index
 
-        rule = self._rules.get(definition)
-        if not rule:
-            rule = self._rules.get(self._yytoken)
-        if rule:
-            return rule(self)
-        return
+        # No transition: roll back to the last accepting position, or try the
+        # next start state if nothing (non-empty) was accepted.
+        if self._last_accept is None or self._last_index == self.lexeme_begin:
+            self.curr_state = self.fail()
+            return
+        self.input_index = self._last_index
+        return self.matched(self._last_accept)
 
     def fail(self):
+        self._last_accept = None
         self.input_index = self.lexeme_begin
         self.start_state = self.get_next_state(self.start_state)
         return self.start_state
 
+    class _DefinitionRules(object):
+        # Rule table whose only rule returns the definition of the token.
+        @staticmethod
+        def _rule(lexer):
+            return lexer._yyid
+
+        def get(self, key):
+            return self._rule
+
+    def tokenize_into(self, ids, starts, ends, stop=None, lookaheads=None):
+        # Append the definition, start and end of every remaining token (up
+        # to the first one starting at or after stop) to ids, starts and ends
+        # (e.g. arrays) without running the rules. lookaheads gets the end of
+        # the text looked at to find each token.
+        rules = self._rules
+        self._rules   = self._DefinitionRules()
+        self._yyslice = False
+        try:
+            while True:
+                if stop is not None and \
+                        self.offset + self.lexeme_begin >= stop:
+                    return ids, starts, ends
+                definition = self.nexttoken()
+                if definition is None:
+                    return ids, starts, ends
+                ids.append(definition)
+                starts.append(self._yystart)
+                ends.append(self._yyend)
+                if lookaheads is not None:
+                    lookaheads.append(max(self._yyscan, self._yyend))
+                self._yyscan = 0
+        finally:
+            self._rules   = rules
+            self._yyslice = True
+
     def match_1(self):
 
-        
         return self.matched(WS)
 
     def match_0(self):
 
         c = self.nextchar()
 
-        if c == ' ':
+        if '\t' <= c <= '\n' or c == '\r' or c == ' ':
             self.curr_state = 1
             return
 
-        if c == 'n':
-            self.curr_state = 1
-            return
-
-        if c == 'r':
-            self.curr_state = 1
-            return
-
-        if c == 't':
-            self.curr_state = 1
-            return
-
-        self.retract()
-        self.curr_state = self.fail()
+        return self.dead()
 
     def match_3(self):
 
-        c = self.nextchar()
-
-        if c == '0':
-            self.curr_state = 3
-            return
-
-        if c == '1':
-            self.curr_state = 3
-            return
-
-        if c == '2':
-            self.curr_state = 3
-            return
-
-        if c == '3':
-            self.curr_state = 3
-            return
+        self.accept(NUMBER)
 
-        if c == '4':
-            self.curr_state = 3
-            return
-
-        if c == '5':
-            self.curr_state = 3
-            return
-
-        if c == '6':
-            self.curr_state = 3
-            return
-
-        if c == '7':
-            self.curr_state = 3
-            return
-
-        if c == '8':
-            self.curr_state = 3
-            return
+        c = self.nextchar()
 
-        if c == '9':
+        if '0' <= c <= '9':
             self.curr_state = 3
             return
 
-        self.retract()
-        return self.matched(NUMBER)
+        return self.dead()
 
     def match_2(self):
 
         c = self.nextchar()
 
-        if c == '0':
+        if '0' <= c <= '9':
             self.curr_state = 3
             return
 
-        if c == '1':
-            self.curr_state = 3
-            return
-
-        if c == '2':
-            self.curr_state = 3
-            return
-
-        if c == '3':
-            self.curr_state = 3
-            return
-
-        if c == '4':
-            self.curr_state = 3
-            return
-
-        if c == '5':
-            self.curr_state = 3
-            return
-
-        if c == '6':
-            self.curr_state = 3
-            return
-
-        if c == '7':
-            self.curr_state = 3
-            return
-
-        if c == '8':
-            self.curr_state = 3
-            return
-
-        if c == '9':
-            self.curr_state = 3
-            return
-
-        self.retract()
-        self.curr_state = self.fail()
+        return self.dead()
 
     def match_5(self):
 
-        
         return self.matched(OPERATOR)
 
     def match_4(self):
 
         c = self.nextchar()
 
-        if c == '*':
+        if '*' <= c <= '+' or c == '-' or c == '/':
             self.curr_state = 5
             return
 
-        if c == '+':
-            self.curr_state = 5
-            return
+        return self.dead()
 
-        if c == '-':
-            self.curr_state = 5
-            return
+    def match_7(self):
 
-        if c == '/':
-            self.curr_state = 5
-            return
+        self.accept(STRING)
 
-        self.retract()
-        self.curr_state = self.fail()
+        c = self.nextchar()
 
-    def match_7(self):
+        if '\x00' <= c <= '\t' or '\x0b' <= c <= '!' or c >= '#':
+            self.curr_state = 8
+            return
 
-        
-        return self.matched(STRING)
+        if c == '"':
+            self.curr_state = 7
+            return
+
+        return self.dead()
 
     def match_6(self):
 
         c = self.nextchar()
 
         if c == '"':
-            self.curr_state = 8
+            self.curr_state = 9
             return
 
-        self.retract()
-        self.curr_state = self.fail()
+        return self.dead()
 
-    def match_8(self):
+    def match_9(self):
 
         c = self.nextchar()
 
-        self.curr_state = 9
-        return
+        if '\x00' <= c <= '\t' or c >= '\x0b':
+            self.curr_state = 8
+            return
 
-    def match_9(self):
+        return self.dead()
+
+    def match_8(self):
 
         c = self.nextchar()
 
+        if '\x00' <= c <= '\t' or '\x0b' <= c <= '!' or c >= '#':
+            self.curr_state = 8
+            return
+
         if c == '"':
             self.curr_state = 7
             return
 
-        self.curr_state = 9
-        return
+        return self.dead()
 
     def match_11(self):
 
-        
         return self.matched(COMMENT)
 
     def match_10(self):
@@ -345,40 +374,45 @@ class PyLexer(object):
             self.curr_state = 12
             return
 
-        self.retract()
-        self.curr_state = self.fail()
+        return self.dead()
 
     def match_12(self):
 
         c = self.nextchar()
 
-        self.curr_state = 13
-        return
+        if '\x00' <= c <= '\t' or c >= '\x0b':
+            self.curr_state = 13
+            return
+
+        return self.dead()
 
     def match_13(self):
 
         c = self.nextchar()
 
-        if c == 'n':
+        if '\x00' <= c <= '\t' or c >= '\x0b':
+            self.curr_state = 13
+            return
+
+        if c == '\n':
             self.curr_state = 11
             return
 
-        self.curr_state = 13
-        return
+        return self.dead()
 
     def install_transitions(self):
 
         self.put_table(0, PyLexer.match_0, 2)
 
-        self.put_table(1, PyLexer.match_1, None)
+        self.put_table(1, PyLexer.match_1, 2)
 
         self.put_table(2, PyLexer.match_2, 4)
 
-        self.put_table(3, PyLexer.match_3, None)
+        self.put_table(3, PyLexer.match_3, 4)
 
         self.put_table(4, PyLexer.match_4, 6)
 
-        self.put_table(5, PyLexer.match_5, None)
+        self.put_table(5, PyLexer.match_5, 6)
 
         self.put_table(8, PyLexer.match_8, 10)
 
@@ -386,7 +420,7 @@ class PyLexer(object):
 
         self.put_table(6, PyLexer.match_6, 10)
 
-        self.put_table(7, PyLexer.match_7, None)
+        self.put_table(7, PyLexer.match_7, 10)
 
         self.put_table(10, PyLexer.match_10, None)
 
@@ -452,9 +486,17 @@ class PyLexer(object):
 # -------------------
 
 
+def tokenize_all(input, bufsize=65536):
+    """
+    Definitions, starts and ends of all tokens of input as parallel arrays.
+    Rules are not run.
+    """
+    return PyLexer(input, bufsize).tokenize_into(array('i'), array('l'), array('l'))
+
 if __name__ == '__main__':
     import sys
-    sm = PyLexer(sys.argv[1])
+    # '-' lexes standard input as a stream.
+    sm = PyLexer(sys.stdin if sys.argv[1] == '-' else sys.argv[1])
     while not sm.eof():
         print sm.nexttoken(), sm.yytoken()
 
@@ -0,0 +1,267 @@
+"""
+Tests of the lexers generated by the backends.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import lang
+
+def spec(*definitions):
+    # The rule of each definition returns it.
+    return "%%%%Constants%%%%\n\n%%%%Definitions%%%%\n\n%s\n\n" \
+           "%%%%Rules%%%%\n\n%s\n\n%%%%Code%%%%\n" % (
+               "\n\n".join(["%s: %s" % d for d in definitions]),
+               "\n\n".join(["%s: return %s" % (d, d) for d, _ in definitions]))
+
+def tokens(text, input, backend="py", **options):
+    """
+    (definition name, token) of every token of input.
+    """
+    cls    = lang.compile(text, backend=backend, **options)
+    module = sys.modules[cls.__module__]
+    names  = dict([(getattr(module, name), name) for name in dir(module)
+                   if name.isupper()])
+    ids, starts, ends = module.tokenize_all(input)
+    return [(names[d], input[s:e]) for d, s, e in zip(ids, starts, ends)]
+
+class MaximalMunchTest(unittest.TestCase):
+    def check(self, text, input, expected, backends=("py", "table", "re")):
+        for backend in backends:
+            # The re backend always tries the definitions in spec order.
+            for combined in (False, True) if backend != "re" else (False,):
+                self.assertEqual(tokens(text, input, backend,
+                                        combined=combined), expected,
+                                 (backend, combined))
+
+    def test_longest_match(self):
+        self.check(spec(("NUM", "[0-9]+"), ("OP", "[-+*/]"), ("WS", "[ ]+")),
+                   "12+345 6",
+                   [("NUM", "12"), ("OP", "+"), ("NUM", "345"), ("WS", " "),
+                    ("NUM", "6")])
+
+    def test_retreat_to_last_accept(self):
+        # "1." is not a number: back up to "1".
+        self.check(spec(("NUM", "[0-9]+(\\.[0-9]+)?"), ("DOT", "\\.")),
+                   "1..3.4",
+                   [("NUM", "1"), ("DOT", "."), ("DOT", "."), ("NUM", "3.4")])
+
+    def test_empty_match_falls_through(self):
+        # WS matches the empty string before each number.
+        self.check(spec(("WS", "[ ]*"), ("NUM", "[0-9]+")), "12 3",
+                   [("NUM", "12"), ("WS", " "), ("NUM", "3")])
+
+    def test_empty_match_at_end(self):
+        self.check(spec(("NUM", "[0-9]+"), ("WS", "[ ]*")), "1 2",
+                   [("NUM", "1"), ("WS", " "), ("NUM", "2")])
+
+    def test_unicode(self):
+        # Chars above ASCII in text (not byte) lexers, in and out of classes.
+        self.check(spec(("YY", u"\u00ff\u0102"),
+                        ("WORD", u"[\u00e9-\u0101]+"), ("WS", "[ ]+")),
+                   u"\u00e9\u0100 \u00ff\u0102\u00ea",
+                   [("WORD", u"\u00e9\u0100"), ("WS", u" "),
+                    ("YY", u"\u00ff\u0102"), ("WORD", u"\u00ea")])
+
+    def test_no_match(self):
+        text = spec(("WS", "[ ]*"), ("NUM", "[0-9]+"))
+        for backend in ("py", "table", "re"):
+            module = sys.modules[lang.compile(text, backend=backend).__module__]
+            self.assertRaises(module.LangException, tokens, text, "1 x",
+                              backend)
+
+class CompileTest(unittest.TestCase):
+    TEXT = spec(("NUM", "[0-9]+"), ("WS", "[ ]+"))
+
+    def test_memoized(self):
+        fd, path = tempfile.mkstemp(".lang")
+        try:
+            os.write(fd, self.TEXT)
+            os.close(fd)
+            cls = lang.compile(self.TEXT)
+            # Same contents and options: the same lexer.
+            self.assertTrue(lang.compile(self.TEXT) is cls)
+            self.assertTrue(lang.compile(path) is cls)
+            self.assertFalse(lang.compile(self.TEXT, spans=True) is cls)
+            self.assertFalse(lang.compile(self.TEXT, backend="table") is cls)
+        finally:
+            os.remove(path)
+
+    def test_missing_spec_file(self):
+        # A single line is a path, not a spec.
+        self.assertRaises(IOError, lang.compile, "no_such_spec.lang")
+
+SAMPLE = spec(("WS", "[ \\t\\n\\r]"), ("NUMBER", "[0-9]+"),
+              ("OPERATOR", "[-+*/]"), ("STRING", '".+"'),
+              ("COMMENT", "#.+\\n"))
+
+def chunks(input, size):
+    for i in range(0, len(input), size):
+        yield input[i:i+size]
+
+class StreamingTest(unittest.TestCase):
+    INPUT = '12 + "ab" "cd" 3 # x\n4'
+
+    def test_chunk_size_does_not_matter(self):
+        for backend in ("py", "table"):
+            cls    = lang.compile(SAMPLE, backend=backend)
+            module = sys.modules[cls.__module__]
+            whole  = module.tokenize_all(self.INPUT)
+            for size in (1, 2, 3, 7, 64):
+                self.assertEqual(module.tokenize_all(chunks(self.INPUT, size),
+                                                     size),
+                                 whole, (backend, size))
+
+    def test_re_refuses_streams(self):
+        module = sys.modules[lang.compile(SAMPLE, backend="re").__module__]
+        self.assertEqual(module.tokenize_all(self.INPUT),
+                         sys.modules[lang.compile(SAMPLE).__module__]
+                         .tokenize_all(self.INPUT))
+        self.assertRaises(TypeError, module.tokenize_all,
+                          chunks(self.INPUT, 3), 3)
+
+class ByteInputTest(unittest.TestCase):
+    INPUT = '12 + "ab" 3 # x\n4 * 5'
+
+    def lex(self, cls, input):
+        lexer = cls(input)
+        out   = []
+        while lexer.nexttoken() is not None:
+            out.append((lexer.yytoken(), str(lexer.yyview())
+                        if not isinstance(lexer.yyview(), memoryview)
+                        else lexer.yyview().tobytes()))
+        return out
+
+    def test_inputs_scanned_in_place(self):
+        expected = [(t, t) for _, t in tokens(SAMPLE, self.INPUT)]
+        for backend in ("py", "table"):
+            for spans in (False, True):
+                cls = lang.compile(SAMPLE, backend=backend, byte_input=True,
+                                   spans=spans)
+                for input in (self.INPUT, memoryview(self.INPUT),
+                              bytearray(self.INPUT)):
+                    self.assertEqual(self.lex(cls, input), expected,
+                                     (backend, spans, type(input)))
+                view = memoryview(self.INPUT)
+                self.assertTrue(cls(view).input is view)
+
+    def test_error_in_memoryview(self):
+        cls    = lang.compile(SAMPLE, byte_input=True)
+        module = sys.modules[cls.__module__]
+        self.assertRaises(module.LangException, self.lex, cls,
+                          memoryview("12 ? 3"))
+
+class LazyTest(unittest.TestCase):
+    INPUT = '12 + "ab" "cd" 3 # x\n4 1..3.4'
+
+    def test_same_as_generated(self):
+        text = spec(("WS", "[ ]*"), ("NUM", "[0-9]+(\\.[0-9]+)?"),
+                    ("DOT", "\\."), ("OP", "[-+*/]"), ("STRING", '"[^"]*"'),
+                    ("COMMENT", "#.*\\n"), ("NL", "\\n"))
+        for combined in (False, True):
+            module = sys.modules[lang.compile(text, combined=combined)
+                                 .__module__]
+            lex = lang.Lang("spec", None, lang.BACKENDS["py"](), text=text,
+                            combined=combined)
+            self.assertEqual(lex.lazy_tokenizer()(self.INPUT),
+                             module.tokenize_all(self.INPUT), combined)
+            self.assertRaises(lang.lang_runtime.LangException,
+                              lex.lazy_tokenizer(), "1 ? 2")
+
+class TokenizeIntoTest(unittest.TestCase):
+    def test_no_token_text(self):
+        # Only offsets are recorded: the text of the tokens is not sliced.
+        lexer = lang.compile(SAMPLE)("12 + 3 4")
+        ids, starts, ends = lexer.tokenize_into([], [], [], stop=6)
+        self.assertEqual((starts, ends), ([0, 2, 3, 4, 5], [2, 3, 4, 5, 6]))
+        self.assertTrue(lexer.yytoken() is None)
+        self.assertEqual(lexer.nexttoken(), ids[1])
+        self.assertEqual(lexer.yytoken(), " ")
+
+class TextRuleTest(unittest.TestCase):
+    def test_rule_keyed_by_text(self):
+        # OP has no rule of its own: "+" is looked up by its text.
+        text = spec(("NUM", "[0-9]+"), ("OP", "[-+]")).replace(
+            "OP: return OP", '"+": return "plus"')
+        for backend in ("py", "table", "re"):
+            for spans in (False, True):
+                lexer = lang.compile(text, backend=backend, spans=spans)("1+2-3")
+                out = []
+                while True:
+                    token = lexer.nexttoken()
+                    if token is None:
+                        break
+                    out.append(token)
+                module = sys.modules[lexer.__module__]
+                self.assertEqual(out, [module.NUM, "plus", module.NUM,
+                                       module.NUM], (backend, spans))
+
+    def test_no_text_lookup(self):
+        source = lang.Lang("spec", None, lang.BACKENDS["py"](spans=True),
+                           text=SAMPLE).source()
+        self.assertFalse("self._rules.get(self.yytoken())" in source)
+
+class InstrumentTest(unittest.TestCase):
+    def stats(self, backend, combined, input):
+        cls = lang.compile(spec(("NUM", "[0-9]+(\\.[0-9]+)?"), ("DOT", "\\."),
+                                ("WS", "[ ]+")),
+                           backend=backend, combined=combined, instrument=True)
+        lexer = cls(input)
+        while lexer.nexttoken() is not None:
+            pass
+        return dict([(counter, sum(counts.values()))
+                     for counter, counts in lexer.stats().items()])
+
+    def test_retracts(self):
+        for backend in ("py", "table"):
+            for combined in (False, True):
+                # The "." after "1" and after "12" are read and given back.
+                stats = self.stats(backend, combined, "1..3 12..")
+                self.assertEqual(stats["retracts"], 2, (backend, combined))
+                self.assertEqual(stats["tokens"], 8)
+                self.assertEqual(stats["token_chars"], 9)
+                stats = self.stats(backend, combined, "1.5 3.4")
+                self.assertEqual(stats["retracts"], 0, (backend, combined))
+
+    def test_same_counts_for_both_backends(self):
+        # Chars are counted where they are consumed, and running out of
+        # input is not a failure.
+        for text, input in ((SAMPLE, '12 + "ab" "cd" 3 # x\n4'),
+                            (spec(("WS", "[ ]*"), ("NUM", "[0-9]+")), "12 3 "),
+                            (SAMPLE, "")):
+            for combined in (False, True):
+                counts = []
+                for backend in ("py", "table"):
+                    lexer = lang.compile(text, backend=backend,
+                                         combined=combined,
+                                         instrument=True)(input)
+                    while lexer.nexttoken() is not None:
+                        pass
+                    counts.append(lexer.stats())
+                self.assertEqual(counts[0], counts[1], (input, combined))
+                self.assertEqual(sum(counts[0]["chars"].values()),
+                                 len(input) + sum(counts[0]["retracts"]
+                                                  .values()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Tests of the DFA cache.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import lang
+import lang_cache
+import pylang_codegen
+import test_lang
+
+SPEC = test_lang.spec(("WS", "[ ]+"), ("NUM", "[0-9]+(\\.[0-9]+)?"),
+                      ("ID", "[a-z_][a-z0-9_]*"))
+
+class DFACacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def source(self, cache):
+        return lang.Lang("spec", None, pylang_codegen.PyLangCodeGen(),
+                         cache=cache, text=SPEC).source()
+
+    def test_hits_generate_the_same_lexer(self):
+        cache = lang_cache.DFACache(self.dir)
+        built = self.source(cache)
+        self.assertEqual(cache.stats["misses"], 3)
+        self.assertEqual(self.source(cache), built)
+        self.assertEqual(cache.stats["hits"], 3)
+        self.assertEqual(built, self.source(None))
+
+    def test_other_versions_are_not_used(self):
+        version = lang_cache.CACHE_VERSION
+        try:
+            lang_cache.CACHE_VERSION = "older sources"
+            self.source(lang_cache.DFACache(self.dir))
+        finally:
+            lang_cache.CACHE_VERSION = version
+
+        cache = lang_cache.DFACache(self.dir)
+        self.source(cache)
+        self.assertEqual(cache.stats["hits"], 0)
+
+    def test_version_follows_sources(self):
+        self.assertEqual(lang_cache.CACHE_VERSION,
+                         lang_cache.sources_version())
+        self.assertNotEqual(lang_cache.sources_version(("regex.py",)),
+                            lang_cache.CACHE_VERSION)
+
+class ProcessesTest(unittest.TestCase):
+    SPEC = test_lang.spec(("WS", "[ \\n]+"), ("NUM", "[0-9]+(\\.[0-9]+)?"),
+                          ("ID", "[a-z_][a-z0-9_]*"), ("OP", "[-+*/=<>]+"),
+                          ("STRING", '"([^"\\\\]|\\\\.)*"'),
+                          ("COMMENT", "/\\*([^*]|\\*+[^*/])*\\*+/"))
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def source(self, processes, cache=None):
+        return lang.Lang("spec", None, pylang_codegen.PyLangCodeGen(),
+                         cache=cache, text=self.SPEC,
+                         processes=processes).source()
+
+    def test_same_source(self):
+        serial = self.source(1)
+        self.assertEqual(self.source(3), serial)
+
+        # Built by the pool into a cold cache, then read back from it.
+        cache = lang_cache.DFACache(self.dir)
+        self.assertEqual(self.source(3, cache), serial)
+        self.assertEqual(cache.stats["hits"], 0)
+        self.assertEqual(self.source(3, cache), serial)
+        self.assertEqual(cache.stats["hits"], 6)
+        self.assertEqual(self.source(1, lang_cache.DFACache(self.dir)), serial)
+
+    def test_partly_cached(self):
+        # Some DFAs from the cache, the others from the pool.
+        serial = self.source(1)
+        lang.Lang("spec", None, pylang_codegen.PyLangCodeGen(),
+                  cache=lang_cache.DFACache(self.dir),
+                  text=test_lang.spec(("WS", "[ \\n]+"),
+                                      ("ID", "[a-z_][a-z0-9_]*"))).source()
+        cache = lang_cache.DFACache(self.dir)
+        self.assertEqual(self.source(3, cache), serial)
+        self.assertEqual(cache.stats["hits"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests of incremental re-lexing against lexing the edited text again.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+import sys
+import unittest
+
+import lang
+import lang_incremental
+import test_lang
+
+SPEC = test_lang.spec(("WS", "[ \\n]+"), ("ID", "[a-z]+"), ("NUM", "[0-9]+"),
+                      ("STRING", '"[^"]*"'),
+                      ("COMMENT", "/\\*([^*]|\\*+[^*/])*\\*+/"))
+
+PIECES = ["abc", "12", " ", "\n", '"x y"', "/* a */", '"', "/*", "*/", "q"]
+
+class TokenBufferTest(unittest.TestCase):
+    def check(self, backend, text, edits, seed):
+        cls    = lang.compile(SPEC, backend=backend)
+        module = sys.modules[cls.__module__]
+        rnd    = random.Random(seed)
+
+        buf = lang_incremental.TokenBuffer(cls, text)
+        for _ in range(edits):
+            n        = len(buf.text)
+            offset   = rnd.randint(0, n)
+            removed  = rnd.randint(0, min(n - offset, 8))
+            inserted = "".join([rnd.choice(PIECES)
+                                for _ in range(rnd.randint(0, 3))])
+            if isinstance(text, unicode):
+                inserted = unicode(inserted)
+            new = buf.text[:offset] + inserted + buf.text[offset+removed:]
+            try:
+                expected = module.tokenize_all(new)
+            except module.LangException:
+                # The edit breaks the text: nothing changes.
+                self.assertRaises(module.LangException, buf.edit, offset,
+                                  removed, inserted)
+                continue
+
+            before = buf.tokens()
+            first, old, count = buf.edit(offset, removed, inserted)
+            self.assertEqual(buf.text, new)
+            self.assertEqual(buf.tokens(), expected)
+            # The tokens outside the window did not change.
+            self.assertEqual(list(expected[0][:first]),
+                             list(before[0][:first]))
+            self.assertEqual(len(expected[0]) - first - count,
+                             len(before[0]) - first - old)
+
+    def text(self, size, seed=1):
+        rnd = random.Random(seed)
+        return "".join([rnd.choice(["abc", "12", " ", "\n", '"x y"',
+                                    "/* a\n b */"]) for _ in range(size)])
+
+    def test_same_as_full_lex(self):
+        for backend in ("py", "table", "re"):
+            self.check(backend, self.text(300), 200, 1)
+
+    def test_unicode(self):
+        self.check("table", unicode(self.text(100)), 100, 2)
+
+    def test_empty(self):
+        self.check("py", "", 50, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests of incremental regeneration: the DFAs of the definitions a spec edit
+leaves alone are reused from the manifest of the previous build.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import imp
+import os
+import shutil
+import tempfile
+import unittest
+
+import lang
+import lang_profile
+import pylang_codegen
+import test_lang
+
+WS  = ("WS", "[ ]+")
+ID  = ("ID", "[a-z]+")
+NUM = ("NUM", "[0-9]+")
+STR = ("STR", '"[^"]*"')
+OP  = ("OP", "[-+]")
+DOT = ("DOT", "\\.")
+
+INPUTS = ['ab 12 "x y" 3.45 + z-7 .', '12 "x" 3.45 + 7 .']
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir   = tempfile.mkdtemp()
+        self.outfn = os.path.join(self.dir, "lexer.py")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self, definitions, combined=False):
+        # Incremental build next to the previous one, and the definitions
+        # whose DFAs were built again.
+        profile = lang_profile.Profile()
+        lang.Lang("spec", self.outfn, pylang_codegen.PyLangCodeGen(),
+                  combined=combined, incremental=True, profile=profile,
+                  text=test_lang.spec(*definitions)).generate()
+        with open(self.outfn) as fh:
+            return fh.read(), sorted(profile.by_unit()[0])
+
+    def fresh(self, definitions, combined=False):
+        return lang.Lang("spec", None, pylang_codegen.PyLangCodeGen(),
+                         combined=combined,
+                         text=test_lang.spec(*definitions)).source()
+
+    def tokens(self, source):
+        # Tokens of each input, None where lexing fails.
+        module = imp.new_module("test_lang_manifest_lexer")
+        exec source in module.__dict__
+        out = []
+        for input in INPUTS:
+            try:
+                out.append(module.tokenize_all(input))
+            except module.LangException:
+                out.append(None)
+        return out
+
+    def test_same_as_fresh_build(self):
+        # Edits keeping the layout of the states: the very same lexer.
+        for combined in (False, True):
+            if os.path.exists(self.outfn + ".manifest"):
+                os.remove(self.outfn + ".manifest")
+            for definitions, built in (
+                    ([WS, ID, NUM, STR], ["ID", "NUM", "STR", "WS"]),
+                    ([WS, ID, NUM, STR], []),
+                    # Same number of states.
+                    ([WS, ("ID", "[a-y]+"), NUM, STR], ["ID"]),
+                    ([WS, ("ID", "[a-y]+"), NUM, STR, OP], ["OP"]),
+                    ([WS, ("ID", "[a-y]+"), NUM, STR], [])):
+                source, units = self.build(definitions, combined)
+                self.assertEqual(source, self.fresh(definitions, combined),
+                                 (definitions, combined))
+                if not combined:
+                    self.assertEqual(units, built, definitions)
+
+    def test_edits_add_and_remove(self):
+        # Rebuilt units may go to gaps left by the others: the states are
+        # numbered differently but the lexer is the same.
+        self.build([WS, ID, NUM, STR, OP])
+        for definitions, built in (
+                ([WS, ID, DOT, NUM, STR, OP], ["DOT"]),
+                ([WS, ID, ("NUM", "[0-9]+(\\.[0-9]+)?"), STR, OP, DOT],
+                 ["NUM"]),
+                ([WS, ("NUM", "[0-9]+(\\.[0-9]+)?"), STR, OP, DOT], []),
+                ([WS, ID, NUM, STR, OP, DOT], ["ID", "NUM"])):
+            source, units = self.build(definitions)
+            self.assertEqual(units, built, definitions)
+            self.assertEqual(self.tokens(source),
+                             self.tokens(self.fresh(definitions)), definitions)
+            # Nothing changed since: the same output again.
+            self.assertEqual(self.build(definitions), (source, []))
+
+if __name__ == '__main__':
+    unittest.main()
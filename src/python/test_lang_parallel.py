@@ -0,0 +1,113 @@
+"""
+Tests of parallel lexing against serial lexing.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import imp
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import lang
+import lang_parallel
+import test_lang
+
+SPEC = test_lang.spec(("WS", "[ \\n]+"), ("ID", "[a-z]+"), ("NUM", "[0-9]+"),
+                      ("COMMENT", "/\\*([^*]|\\*+[^*/])*\\*+/"))
+
+def corpus(size, seed=1):
+    # Code with comments spanning many lines, so that chunk boundaries fall
+    # inside them.
+    rnd   = random.Random(seed)
+    parts = []
+    n     = 0
+    while n < size:
+        if rnd.random() < 0.1:
+            part = "/* %s */" % "\n".join(["x * %d" % i for i in
+                                           range(rnd.randint(1, 40))])
+        else:
+            part = rnd.choice(["abc", "12", " ", "\n", "q", "345"])
+        parts.append(part)
+        n += len(part)
+    return "".join(parts)
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.dir  = tempfile.mkdtemp()
+        self.data = corpus(60000)
+        self.path = os.path.join(self.dir, "input.txt")
+        with open(self.path, "wb") as fh:
+            fh.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def lexer(self, backend, byte_input=False):
+        name = "lexer_%s%s" % (backend, "_bytes" if byte_input else "")
+        path = os.path.join(self.dir, name + ".py")
+        lang.Lang("spec", path, lang.BACKENDS[backend](byte_input=byte_input),
+                  text=SPEC).generate()
+        return path, imp.load_source("test_" + name, path)
+
+    def test_same_as_serial(self):
+        # re backend lexers scan the memory mapped file, which only byte
+        # lexers take.
+        for backend, byte_input in (("py", False), ("table", False),
+                                    ("re", True)):
+            path, module = self.lexer(backend, byte_input)
+            serial = module.tokenize_all(self.data)
+            for chunk_size in (1000, 7000):
+                self.assertEqual(lang_parallel.tokenize_file(
+                                     path, self.path, 2, chunk_size),
+                                 serial, (backend, chunk_size))
+
+    def test_re_needs_byte_input(self):
+        path, _ = self.lexer("re")
+        self.assertRaises(TypeError, lang_parallel.tokenize_file, path,
+                          self.path, 2)
+
+    def test_resync_lexes_little(self):
+        path, module = self.lexer("table")
+        ids, starts, ends = module.tokenize_all(self.data)
+        lang_parallel._init(path, self.path, lang_parallel.BUFSIZE)
+        resynced = 0
+        for begin, end in lang_parallel.boundaries(self.data, 5000):
+            # End of the last token starting before the chunk.
+            k   = bisect.bisect_left(starts, begin)
+            pos = ends[k-1] if k else 0
+            if pos == begin or pos >= end:
+                continue
+            tokens, n = lang_parallel._resync(
+                lang_parallel._lex_range((begin, end)), pos, end)
+            first = bisect.bisect_left(starts, pos)
+            last  = bisect.bisect_left(starts, end)
+            self.assertEqual(tokens, (ids[first:last], starts[first:last],
+                                      ends[first:last]))
+            # Only up to the end of the comment the chunk began in, not the
+            # whole chunk.
+            self.assertTrue(n < 1000, n)
+            resynced += 1
+        self.assertTrue(resynced > 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests of the profile of the generator pipeline.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import unittest
+from cStringIO import StringIO
+
+import lang
+import lang_profile
+import pylang_codegen
+import test_lang
+
+NAMES = ["WS", "NUMBER", "OPERATOR", "STRING", "COMMENT"]
+
+class ProfileTest(unittest.TestCase):
+    def profile(self, **options):
+        # Source of the sample lexer, and its profile as read back from JSON.
+        profile = lang_profile.Profile()
+        source  = lang.Lang("spec", None, pylang_codegen.PyLangCodeGen(),
+                            text=test_lang.SAMPLE, profile=profile,
+                            **options).source()
+        fh = StringIO()
+        profile.dump(fh)
+        return source, json.loads(fh.getvalue())
+
+    def test_stages_and_units(self):
+        for processes in (1, 3):
+            source, profile = self.profile(processes=processes)
+            stages, units, total = (profile["stages"], profile["units"],
+                                    profile["total"])
+            self.assertEqual(sorted(stages), sorted(lang_profile.STAGES))
+            self.assertEqual(sorted(units), sorted(NAMES))
+            self.assertEqual(stages["parse"]["sizes"], {"definitions": 5})
+            for name in NAMES:
+                sizes = units[name]["sizes"]
+                self.assertTrue(sizes["nfa_states"] > 0, name)
+                self.assertEqual(sizes["min_dfa_states"], sizes["states"])
+            for key in ("nfa_states", "dfa_states", "states"):
+                self.assertEqual(total["sizes"][key],
+                                 sum([units[n]["sizes"][key] for n in NAMES]))
+            self.assertAlmostEqual(total["seconds"],
+                                   sum([s["seconds"]
+                                        for s in stages.values()]))
+
+    def test_output_size(self):
+        # The code of the matchers and of the transitions is part of the
+        # output, not added to it.
+        source, profile = self.profile()
+        self.assertEqual(profile["stages"]["emit"]["sizes"]["code_bytes"],
+                         len(source))
+        self.assertEqual(profile["total"]["sizes"]["code_bytes"],
+                         len(source))
+        self.assertTrue(profile["stages"]["matcher_gen"]["sizes"]
+                        ["code_bytes"] < len(source))
+
+    def test_combined(self):
+        _, profile = self.profile(combined=True)
+        self.assertEqual(profile["units"].keys(), [",".join(NAMES)])
+        self.assertEqual(profile["units"][",".join(NAMES)]["sizes"]
+                         ["code_bytes"],
+                         profile["stages"]["matcher_gen"]["sizes"]
+                         ["code_bytes"])
+
+if __name__ == '__main__':
+    unittest.main()
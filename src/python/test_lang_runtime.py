@@ -0,0 +1,93 @@
+"""
+Tests of binary DFAs against the generated lexers.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import lang
+import lang_runtime
+import pytable_codegen
+
+SPEC = """
+%%Constants%%
+
+WS = 10
+
+%%Definitions%%
+
+WS: [ ]+
+
+NUM: [0-9]+
+
+ID: [a-z]+
+
+%%Rules%%
+
+%%Code%%
+"""
+
+class BinaryDFATest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def binary(self, text, combined=False):
+        spec = os.path.join(self.dir, "spec.lang")
+        with open(spec, "w") as fh:
+            fh.write(text)
+        path = os.path.join(self.dir, "spec.dfa")
+        lang.Lang(spec, path, pytable_codegen.PyTableLangCodeGen(),
+                  combined=combined).generate_binary()
+        return lang_runtime.DFA.load(path)
+
+    def test_ids_match_generated_module(self):
+        input = "12 abc 3 x"
+        for combined in (False, True):
+            dfa    = self.binary(SPEC, combined)
+            cls    = lang.compile(SPEC, backend="table", combined=combined)
+            module = sys.modules[cls.__module__]
+
+            ids, starts, ends = lang_runtime.tokenize_all(dfa, input)
+            expected = module.tokenize_all(input)
+            self.assertEqual(list(ids), list(expected[0]))
+            self.assertEqual(list(starts), list(expected[1]))
+            self.assertEqual(list(ends), list(expected[2]))
+            self.assertEqual(list(ids)[:3], [module.NUM, module.WS, module.ID])
+            self.assertEqual(module.WS, 10)
+
+    def test_round_trip(self):
+        dfa = self.binary(SPEC)
+        copy = lang_runtime.DFA.loads(dfa.dumps())
+        self.assertEqual(copy.dumps(), dfa.dumps())
+        self.assertEqual(copy.names, dfa.names)
+
+    def test_bad_file(self):
+        self.assertRaises(lang_runtime.FormatError, lang_runtime.DFA.loads,
+                          "not a dfa")
+
+if __name__ == '__main__':
+    unittest.main()
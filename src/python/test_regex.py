@@ -0,0 +1,278 @@
+"""
+Tests of the subset construction, the minimization, the NFA simulation, the
+lazy DFA and of compilations running concurrently.
+
+Author: Mayur P Srivastava
+
+
+Copyright (C) Mayur P Srivastava
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+import threading
+import unittest
+
+import regex
+
+PATTERNS = ["(a|b)*a(a|b)(a|b)(a|b)", "[0-9]+(\\.[0-9]+)?", "a*", "ab|abc|b+",
+            "[^ab]+"]
+
+def inputs(n, seed=1):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield "".join([rnd.choice("ab1.2 x")
+                       for _ in range(rnd.randint(0, 30))])
+
+def subset_construction(table, s0, syms):
+    # The DFA of nfa_to_dfa, from e_closure and move.
+    start = regex.e_closure([s0], table)
+    dfa   = {}
+    todo  = [start]
+    while todo:
+        T = todo.pop()
+        if T in dfa:
+            continue
+        dfa[T] = {}
+        for a in syms:
+            U = regex.e_closure(regex.move(table, T, a), table)
+            if U:
+                dfa[T][a] = U
+                todo.append(U)
+    return start, dfa
+
+class SubsetConstructionTest(unittest.TestCase):
+    def check(self, rx):
+        args = (rx.nfa_table(), rx.nfa_start(), rx.syms())
+        self.assertEqual(regex.nfa_to_dfa(*args), subset_construction(*args))
+
+    def test_same_as_e_closure(self):
+        for p in PATTERNS:
+            self.check(regex.Regex(p))
+        self.check(regex.RegexSet(PATTERNS))
+
+    def test_long_literal(self):
+        # One DFA state per prefix of the literal.
+        rx = regex.Regex("abcdefgh" * 2000)
+        self.assertEqual(rx.stats()["dfa_states"], 16001)
+
+    def test_wide_alternation(self):
+        # The SPLIT chains of the alternation and of the joined patterns
+        # hold no closure of their own.
+        words = ["x%d" % i for i in range(4000)]
+        for rx in (regex.Regex("|".join(words)), regex.RegexSet(words)):
+            table    = rx.nfa_table()
+            closures = regex._closures(table, rx.nfa_start())
+            self.assertTrue(sum(map(len, closures.values())) < 4 * len(table))
+            self.assertEqual(rx.accepts(rx.dfa_start()), None)
+        self.assertTrue(rx.dfa_match("x3999"))
+        self.assertFalse(rx.dfa_match("x4000"))
+
+class LargePatternTest(unittest.TestCase):
+    def literal(self, n):
+        rnd = random.Random(n)
+        return "".join([rnd.choice("abcdefgh") for _ in range(n)])
+
+    def alternation(self, n):
+        return "|".join(["x%d" % i for i in range(n)])
+
+    def size(self, rx):
+        # NFA states held by the states of the DFA and by the closures they
+        # are built from.
+        closures = regex._closures(rx.nfa_table(), rx.nfa_start())
+        return sum([len(T) for T in rx.dfa_table()] +
+                   [len(c) for c in closures.values()])
+
+    def test_literal(self):
+        text = self.literal(30000)
+        rx   = regex.Regex(text, True)
+        self.assertEqual(rx.stats()["nfa_states"], 30001)
+        self.assertEqual(rx.stats()["min_dfa_states"], 30001)
+        self.assertTrue(rx.dfa_match(text))
+        self.assertFalse(rx.dfa_match(text[:-1]))
+
+    def test_wide_alternation(self):
+        rx = regex.Regex(self.alternation(10000), True)
+        self.assertTrue(rx.stats()["nfa_states"] > 50000)
+        self.assertTrue(rx.dfa_match("x9999"))
+        self.assertFalse(rx.dfa_match("x10000"))
+
+    def test_linear(self):
+        for pattern in (self.literal, self.alternation):
+            small = self.size(regex.Regex(pattern(2000)))
+            large = self.size(regex.Regex(pattern(4000)))
+            self.assertTrue(large < 2.5 * small, (pattern, small, large))
+
+class ThreadsTest(unittest.TestCase):
+    def tables(self, rx):
+        return (rx.nfa_start(), rx.nfa_table(), rx.dfa_start(), rx.dfa_table(),
+                rx.classes(), rx.stats())
+
+    def compile(self, i):
+        # Each pattern on its own, then all of them together.
+        if i < len(PATTERNS):
+            return regex.Regex(PATTERNS[i], True)
+        return regex.RegexSet(PATTERNS, True)
+
+    def test_same_as_serial(self):
+        # Compilations share no state: the same tables whatever runs at the
+        # same time.
+        n      = len(PATTERNS) + 1
+        serial = [self.tables(self.compile(i)) for i in range(n)]
+
+        go      = threading.Event()
+        results = {}
+        def run(t):
+            go.wait()
+            for k in range(20):
+                i = (t + k) % n
+                results[t, k] = (i, self.tables(self.compile(i)))
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in range(8)]
+        for thread in threads:
+            thread.start()
+        go.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8 * 20)
+        for (t, k), (i, tables) in results.items():
+            self.assertEqual(tables, serial[i], (t, k, i))
+
+def refine(start, table, label):
+    # The DFA of minimize_dfa, splitting blocks by the blocks of the targets
+    # of their states until none splits.
+    DEAD   = ()
+    states = sorted(table) + [DEAD]
+    syms   = sorted(set([a for row in table.values() for a in row]))
+
+    def target(s, a):
+        return table.get(s, {}).get(a, DEAD)
+
+    block = dict([(s, label(s) if s != DEAD else None) for s in states])
+    while True:
+        split = dict([(s, (block[s],) + tuple([block[target(s, a)]
+                                               for a in syms]))
+                      for s in states])
+        if len(set(split.values())) == len(set(block.values())):
+            break
+        block = split
+
+    rep = {}
+    for s in states:
+        rep[s] = min([t for t in states if block[t] == block[s]])
+    min_table = {}
+    for s in table:
+        if rep[s] != rep[DEAD]:
+            min_table[rep[s]] = dict([(a, rep[t]) for a, t in table[s].items()
+                                      if rep[t] != rep[DEAD]])
+    return rep[start], min_table
+
+class MinimizeTest(unittest.TestCase):
+    def check(self, rx):
+        args = (rx.dfa_start(), rx.dfa_table(), rx.accepts)
+        self.assertEqual(regex.minimize_dfa(*args), refine(*args))
+
+    def test_same_as_refinement(self):
+        for p in PATTERNS + ["(a|b)*(abb|bab)(a|b)*", "(ab|ba)*|b(ab)*a"]:
+            self.check(regex.Regex(p))
+        self.check(regex.RegexSet(PATTERNS))
+
+    def test_same_language(self):
+        for p in PATTERNS:
+            rx, min_rx = regex.Regex(p), regex.Regex(p, True)
+            self.assertTrue(min_rx.stats()["min_dfa_states"] <=
+                            rx.stats()["dfa_states"])
+            for input in inputs(300):
+                self.assertEqual(min_rx.dfa_match(input), rx.dfa_match(input),
+                                 (p, input))
+
+class NFASimulationTest(unittest.TestCase):
+    def search(self, rx, input, pos):
+        # Leftmost longest match, from the DFA.
+        for start in range(pos, len(input) + 1):
+            end = rx.longest_match(input, start)
+            if end is not None:
+                return start, end
+        return None
+
+    def test_same_as_dfa(self):
+        for p in PATTERNS:
+            rx = regex.Regex(p)
+            for input in inputs(300):
+                self.assertEqual(rx.nfa_match(input), rx.dfa_match(input),
+                                 (p, input))
+                for pos in (0, len(input) / 2):
+                    self.assertEqual(rx.nfa_search(input, pos),
+                                     self.search(rx, input, pos),
+                                     (p, input, pos))
+
+    def test_deep_patterns(self):
+        n  = 300
+        rx = regex.Regex("a?" * n + "a" * n, lazy=True)
+        self.assertTrue(rx.nfa_match("a" * n))
+        self.assertTrue(rx.nfa_match("a" * (2 * n)))
+        self.assertFalse(rx.nfa_match("a" * (2 * n + 1)))
+        self.assertEqual(rx.nfa_search("xx" + "a" * (n + 5) + "b"),
+                         (2, n + 7))
+        self.assertTrue(regex.Regex("(" * 400 + "a" + ")" * 400)
+                        .nfa_match("a"))
+
+class LazyDFATest(unittest.TestCase):
+    def check(self, lazy, eager):
+        for input in inputs(300):
+            self.assertEqual(lazy.dfa_match(input), eager.dfa_match(input),
+                             input)
+            for pos in range(len(input) + 1):
+                self.assertEqual(lazy.longest_match(input, pos),
+                                 eager.longest_match(input, pos), (input, pos))
+                self.assertEqual(lazy.longest_accept(input, pos),
+                                 eager.longest_accept(input, pos),
+                                 (input, pos))
+
+    def test_same_as_eager(self):
+        for p in PATTERNS:
+            self.check(regex.Regex(p, lazy=True), regex.Regex(p, True))
+
+    def test_regex_set(self):
+        self.check(regex.RegexSet(PATTERNS, lazy=True),
+                   regex.RegexSet(PATTERNS, True))
+
+    def test_small_cache(self):
+        # The cache is flushed, then the scan falls back to the NFA.
+        lazy = regex.Regex(PATTERNS[0], lazy=True)
+        lazy._lazy.max_states = 4
+        self.check(lazy, regex.Regex(PATTERNS[0]))
+        stats = lazy.stats()
+        self.assertTrue(stats["lazy_flushes"] > 0)
+        self.assertTrue(stats["nfa_fallbacks"] > 0)
+        self.assertFalse("dfa_states" in stats)
+
+    def test_builds_what_the_input_reaches(self):
+        words = ["x%d" % i for i in range(4000)]
+        rx    = regex.Regex(".*(%s)" % "|".join(words), lazy=True)
+        self.assertTrue(rx.dfa_match("abcdx3999"))
+        self.assertEqual(rx.longest_accept("abcdx12 y"), (7, 0))
+        self.assertTrue(rx.stats()["lazy_states"] <= 10)
+        # Closures only of the NFA states the scans went through, not of all
+        # the branches.
+        n = len(rx.nfa_table())
+        self.assertTrue(len(rx._lazy._closures) < n / 2)
+
+        self.assertTrue(rx.nfa_match("abcdx3999"))
+        self.assertTrue(len(rx._simulation()[2]) < n / 2)
+
+if __name__ == '__main__':
+    unittest.main()